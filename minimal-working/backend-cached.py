@@ -2,10 +2,13 @@
 """
 Cached NixOS Package Search Backend
 Adds caching to reduce repeated nix-env calls
+
+Run with --workers N to pre-fork N worker processes on one listening socket;
+the caches then live in a shared SQLite file instead of per-process dicts
 """
 
-from http.server import HTTPServer, BaseHTTPRequestHandler
-from urllib.parse import urlparse, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs, unquote
 import subprocess
 import json
 import re
@@ -13,53 +16,1368 @@ import os
 import sys
 import time
 import hashlib
+import threading
+import argparse
+import signal
+import sqlite3
+import mmap
+import fcntl
+import queue
+from contextlib import contextmanager
 
-class CachedPackageSearchHandler(BaseHTTPRequestHandler):
-    # Class-level cache shared across all requests
-    search_cache = {}
-    installed_cache = {'packages': set(), 'timestamp': 0}
+CACHE_DIR = os.path.join(os.environ.get('XDG_CACHE_HOME', os.path.expanduser('~/.cache')), 'nixos-gui')
+
+class Metrics:
+    """Thread-safe counters and histograms, rendered in Prometheus text format"""
+    BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+    HELP = {
+        'nixgui_requests_total': ('counter', 'HTTP requests served, by endpoint'),
+        'nixgui_request_duration_seconds': ('histogram', 'Time from request start to last byte written'),
+        'nixgui_search_phase_seconds': ('histogram', 'Time spent in each phase of a /search request'),
+        'nixgui_cache_hits_total': ('counter', 'Search cache hits'),
+        'nixgui_cache_misses_total': ('counter', 'Search cache misses'),
+        'nixgui_cache_evictions_total': ('counter', 'Search cache entries removed, by reason'),
+        'nixgui_negative_cache_hits_total': ('counter', 'Searches answered from the failure cache'),
+        'nixgui_package_cache_hits_total': ('counter', 'Package detail lookups answered from cache'),
+        'nixgui_package_cache_misses_total': ('counter', 'Package detail lookups that ran nix-env'),
+        'nixgui_negative_cache_stores_total': ('counter', 'Failed searches cached, by reason'),
+        'nixgui_negative_cache_entries': ('gauge', 'Entries currently in the failure cache'),
+        'nixgui_subprocess_total': ('counter', 'Nix subprocesses started, by command'),
+        'nixgui_subprocess_failures_total': ('counter', 'Nix subprocesses that failed or timed out, by command'),
+        'nixgui_catalog_searches_total': ('counter', 'Cache misses answered from the catalog instead of nix-env'),
+        'nixgui_evaluator_queries_total': ('counter', 'Cache misses answered by the warm nix repl'),
+        'nixgui_evaluator_restarts_total': ('counter', 'Nix evaluator restarts, by reason'),
+        'nixgui_prewarmed_queries_total': ('counter', 'Logged frequent queries searched ahead of time'),
+        'nixgui_search_cache_entries': ('gauge', 'Entries currently in the search cache'),
+        'nixgui_installed_packages': ('gauge', 'Packages in the installed-package snapshot'),
+    }
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}    # (name, labels) -> value
+        self.histograms = {}  # (name, labels) -> {'buckets': [...], 'sum': s, 'count': n}
+    
+    def inc(self, name, labels=(), value=1):
+        key = (name, tuple(labels))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+    
+    def get(self, name, labels=()):
+        with self.lock:
+            return self.counters.get((name, tuple(labels)), 0)
+    
+    def observe(self, name, seconds, labels=()):
+        key = (name, tuple(labels))
+        with self.lock:
+            hist = self.histograms.get(key)
+            if hist is None:
+                hist = {'buckets': [0] * len(self.BUCKETS), 'sum': 0.0, 'count': 0}
+                self.histograms[key] = hist
+            for i, bound in enumerate(self.BUCKETS):
+                if seconds <= bound:
+                    hist['buckets'][i] += 1
+            hist['sum'] += seconds
+            hist['count'] += 1
+    
+    def snapshot(self):
+        """JSON-friendly copy of every counter and histogram"""
+        with self.lock:
+            return {
+                'counters': [[name, labels, value] for (name, labels), value in self.counters.items()],
+                'histograms': [[name, labels, hist] for (name, labels), hist in self.histograms.items()]
+            }
+    
+    @classmethod
+    def merged(cls, snapshots):
+        """Sum snapshots from several worker processes into one registry"""
+        total = cls()
+        for snap in snapshots:
+            for name, labels, value in snap['counters']:
+                key = (name, tuple(tuple(pair) for pair in labels))
+                total.counters[key] = total.counters.get(key, 0) + value
+            for name, labels, hist in snap['histograms']:
+                key = (name, tuple(tuple(pair) for pair in labels))
+                into = total.histograms.setdefault(
+                    key, {'buckets': [0] * len(cls.BUCKETS), 'sum': 0.0, 'count': 0})
+                into['buckets'] = [a + b for a, b in zip(into['buckets'], hist['buckets'])]
+                into['sum'] += hist['sum']
+                into['count'] += hist['count']
+        return total
+    
+    @staticmethod
+    def format_labels(labels, extra=()):
+        pairs = list(labels) + list(extra)
+        if not pairs:
+            return ''
+        return '{' + ','.join(f'{k}="{v}"' for k, v in pairs) + '}'
+    
+    def render(self, gauges=None):
+        """Return all metrics as Prometheus exposition text"""
+        lines = []
+        with self.lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted((key, dict(hist, buckets=list(hist['buckets'])))
+                                for key, hist in self.histograms.items())
+        samples = {}
+        for (name, labels), value in counters:
+            samples.setdefault(name, []).append(f"{name}{self.format_labels(labels)} {value}")
+        for (name, labels), hist in histograms:
+            out = samples.setdefault(name, [])
+            for bound, count in zip(self.BUCKETS, hist['buckets']):
+                out.append(f"{name}_bucket{self.format_labels(labels, [('le', bound)])} {count}")
+            out.append(f"{name}_bucket{self.format_labels(labels, [('le', '+Inf')])} {hist['count']}")
+            out.append(f"{name}_sum{self.format_labels(labels)} {hist['sum']:.6f}")
+            out.append(f"{name}_count{self.format_labels(labels)} {hist['count']}")
+        for name, value in (gauges or {}).items():
+            samples[name] = [f"{name} {value}"]
+        for name in sorted(samples):
+            kind, text = self.HELP.get(name, ('untyped', name))
+            lines.append(f"# HELP {name} {text}")
+            lines.append(f"# TYPE {name} {kind}")
+            lines.extend(samples[name])
+        return '\n'.join(lines) + '\n'
+
+metrics = Metrics()
+
+class SharedCache:
+    """Dict-like cache in SQLite, so pre-forked workers share one copy
+    
+    Values are stored as JSON; decoders restore non-JSON types per key
+    (e.g. the installed package set). Each thread gets its own connection.
+    An entry's 'timestamp' and 'ttl' are also kept in columns, so expired
+    entries can be deleted without reading every row.
+    """
+    
+    def __init__(self, path, namespace, decoders=None):
+        self.path = path
+        self.namespace = namespace
+        self.decoders = decoders or {}
+        self.local = threading.local()
+    
+    @staticmethod
+    def initialize(path):
+        """Create the database and table; called once before forking"""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        conn = sqlite3.connect(path)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('CREATE TABLE IF NOT EXISTS cache ('
+                     'namespace TEXT, key TEXT, value TEXT, timestamp REAL, ttl REAL, '
+                     'PRIMARY KEY (namespace, key))')
+        # Databases from before the expiry columns
+        columns = {row[1] for row in conn.execute('PRAGMA table_info(cache)')}
+        for column in ('timestamp', 'ttl'):
+            if column not in columns:
+                conn.execute(f'ALTER TABLE cache ADD COLUMN {column} REAL')
+        conn.execute('CREATE INDEX IF NOT EXISTS cache_timestamp ON cache (namespace, timestamp)')
+        conn.commit()
+        conn.close()
+    
+    def db(self):
+        # Connections must not cross a fork, so remember which process made them
+        conn = getattr(self.local, 'conn', None)
+        if conn is None or self.local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self.local.conn = conn
+            self.local.pid = os.getpid()
+        return conn
+    
+    def decode(self, key, value):
+        value = json.loads(value)
+        decoder = self.decoders.get(key)
+        return decoder(value) if decoder else value
+    
+    def get(self, key, default=None):
+        row = self.db().execute('SELECT value FROM cache WHERE namespace = ? AND key = ?',
+                                (self.namespace, key)).fetchone()
+        return self.decode(key, row[0]) if row else default
+    
+    def __getitem__(self, key):
+        row = self.db().execute('SELECT value FROM cache WHERE namespace = ? AND key = ?',
+                                (self.namespace, key)).fetchone()
+        if row is None:
+            raise KeyError(key)
+        return self.decode(key, row[0])
+    
+    @staticmethod
+    def expiry(value):
+        """The timestamp and ttl columns for a value, if it carries them"""
+        if isinstance(value, dict):
+            return value.get('timestamp'), value.get('ttl')
+        return None, None
+    
+    def __setitem__(self, key, value):
+        self.db().execute('INSERT OR REPLACE INTO cache (namespace, key, value, timestamp, ttl) '
+                          'VALUES (?, ?, ?, ?, ?)',
+                          (self.namespace, key, json.dumps(value, default=list), *self.expiry(value)))
+    
+    def __contains__(self, key):
+        return self.db().execute('SELECT 1 FROM cache WHERE namespace = ? AND key = ?',
+                                 (self.namespace, key)).fetchone() is not None
+    
+    def __len__(self):
+        return self.db().execute('SELECT COUNT(*) FROM cache WHERE namespace = ?',
+                                 (self.namespace,)).fetchone()[0]
+    
+    def pop(self, key, default=None):
+        value = self.get(key, default)
+        self.db().execute('DELETE FROM cache WHERE namespace = ? AND key = ?', (self.namespace, key))
+        return value
+    
+    def setdefault(self, key, value):
+        """Atomically store value unless key exists; return what is stored"""
+        self.db().execute('INSERT OR IGNORE INTO cache (namespace, key, value, timestamp, ttl) '
+                          'VALUES (?, ?, ?, ?, ?)',
+                          (self.namespace, key, json.dumps(value, default=list), *self.expiry(value)))
+        return self[key]
+    
+    def clear(self):
+        self.db().execute('DELETE FROM cache WHERE namespace = ?', (self.namespace,))
+    
+    def items(self):
+        rows = self.db().execute('SELECT key, value FROM cache WHERE namespace = ?',
+                                 (self.namespace,)).fetchall()
+        return [(key, self.decode(key, value)) for key, value in rows]
+    
+    def values(self):
+        return [value for _, value in self.items()]
+    
+    def expire(self, ttl, now=None):
+        """Delete entries older than their own ttl (default ttl); return the count"""
+        cursor = self.db().execute('DELETE FROM cache WHERE namespace = ? AND timestamp + COALESCE(ttl, ?) < ?',
+                                   (self.namespace, ttl, now or time.time()))
+        return cursor.rowcount
+    
+    def evict_oldest(self, count):
+        self.db().execute('DELETE FROM cache WHERE namespace = ? AND key IN ('
+                          'SELECT key FROM cache WHERE namespace = ? ORDER BY timestamp LIMIT ?)',
+                          (self.namespace, self.namespace, count))
+
+class MemoryCache(dict):
+    """A dict with SharedCache's expiry methods, for single-process mode"""
+    
+    def expire(self, ttl, now=None):
+        now = now or time.time()
+        expired = [key for key, entry in list(self.items())
+                   if now - entry['timestamp'] > entry.get('ttl', ttl)]
+        for key in expired:
+            self.pop(key, None)
+        return len(expired)
+    
+    def evict_oldest(self, count):
+        oldest = sorted(list(self.items()), key=lambda item: item[1]['timestamp'])
+        for key, _ in oldest[:count]:
+            self.pop(key, None)
+
+class QueryLog:
+    """Bounded query frequency counts, persisted as JSON across restarts
+    
+    Searches are counted in memory and merged into the file by flush(),
+    under a file lock so several workers can share it. Counts halve every
+    HALF_LIFE seconds, so queries nobody types any more drop out.
+    """
+    
+    HALF_LIFE = 7 * 24 * 3600
+    
+    def __init__(self, path, size=2000):
+        self.path = path
+        self.size = size
+        self.pending = {}
+        self.lock = threading.Lock()
+    
+    def record(self, query):
+        with self.lock:
+            self.pending[query] = self.pending.get(query, 0) + 1
+    
+    def load(self):
+        """Counts from the file, decayed to the current time"""
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        age = max(time.time() - data.get('updated', time.time()), 0)
+        decay = 0.5 ** (age / self.HALF_LIFE)
+        return {query: count * decay for query, count in data.get('counts', {}).items()}
+    
+    def flush(self):
+        """Merge pending counts into the file, keeping the top `size` queries"""
+        with self.lock:
+            pending, self.pending = self.pending, {}
+        if not pending:
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path + '.lock', 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            counts = self.load()
+            for query, count in pending.items():
+                counts[query] = counts.get(query, 0) + count
+            top = sorted(counts.items(), key=lambda item: item[1], reverse=True)[:self.size]
+            tmp_path = f'{self.path}.{os.getpid()}.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump({'updated': time.time(), 'counts': {q: round(c, 3) for q, c in top}}, f)
+            os.replace(tmp_path, self.path)
+    
+    def top(self, n):
+        """The n most frequent queries, including ones not flushed yet"""
+        counts = self.load()
+        with self.lock:
+            for query, count in self.pending.items():
+                counts[query] = counts.get(query, 0) + count
+        return [q for q, _ in sorted(counts.items(), key=lambda item: item[1], reverse=True)[:n]]
+    
+    def __len__(self):
+        return len(self.load())
+
+class Catalog:
+    """Every package from one full `nix-env -qa` run, mmapped for searching
+    
+    The file has a header line, then one 'name<TAB>attr<TAB>version' line
+    per package in nix-env order. Each process maps the same file, so
+    pre-forked workers share its pages instead of holding copies.
+    """
+    HEADER = b'# nixos-gui catalog v1'
+    # Queries containing these are real regexes; leave them to nix-env
+    REGEX_CHARS = set('.^$*+?{}[]\\|()')
+    # nix splits 'name-version' at the first '-' not followed by a letter, and
+    # nix-env matches selectors against the name part only
+    VERSION_SPLIT = re.compile(r'-(?=[^A-Za-z])')
+    VERSION_SPLIT_BYTES = re.compile(rb'-(?=[^A-Za-z])')
+    
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self.mtime = os.fstat(f.fileno()).st_mtime
+        header = self.map.readline()
+        if not header.startswith(self.HEADER):
+            raise ValueError(f'{path} is not a catalog file')
+        self.count = int(header.split()[-1])
+        self.body_start = len(header)
+    
+    @classmethod
+    def write(cls, path, packages):
+        """Write nix-env -qa --json output as a catalog file, atomically"""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(f'{cls.HEADER.decode()} {len(packages)}\n')
+            for attr, info in packages.items():
+                name = info.get('name', attr).replace('\t', ' ').replace('\n', ' ')
+                f.write(f"{name}\t{attr}\t{info.get('version', 'unknown')}\n")
+        os.replace(tmp_path, path)
+    
+    @classmethod
+    def can_answer(cls, query):
+        # nix-env would split such a selector into a name and a version too
+        return not (cls.REGEX_CHARS & set(query) or cls.VERSION_SPLIT.search(f'.*{query}.*'))
+    
+    @classmethod
+    def package_name(cls, name):
+        """Name part of a derivation name, like builtins.parseDrvName"""
+        match = cls.VERSION_SPLIT.search(name)
+        return name[:match.start()] if match else name
+    
+    def search(self, query, limit=50):
+        """Packages whose name (without version) contains query, like nix-env -qa '.*query.*'
+        
+        Returns (first `limit` matches as attr -> info, total match count).
+        """
+        needle = query.encode()
+        data = self.map
+        matches = {}
+        total = 0
+        pos = data.find(needle, self.body_start)
+        while pos != -1:
+            line_start = data.rfind(b'\n', 0, pos) + 1
+            name_end = data.find(b'\t', line_start)
+            line_end = data.find(b'\n', pos)
+            if line_end == -1:
+                line_end = len(data)
+            # The first hit on a line is past the name: the name doesn't match
+            split = self.VERSION_SPLIT_BYTES.search(data, line_start, name_end)
+            if pos + len(needle) <= (split.start() if split else name_end):
+                total += 1
+                if len(matches) < limit:
+                    name, attr, version = data[line_start:line_end].decode().split('\t')
+                    matches[attr] = {'name': name, 'version': version}
+            pos = data.find(needle, line_end + 1)
+        return matches, total
+    
+    def close(self):
+        self.map.close()
+
+class EvaluatorError(Exception):
+    """The evaluator could not answer; the caller falls back to nix-env"""
+
+class Evaluator:
+    """A long-lived `nix repl` with nixpkgs loaded, searched over a pipe
+    
+    Startup defines nixguiIndex, every package in nixpkgs as nix-env -qa
+    would list it, and forces it once. The repl keeps it in memory, so a
+    search afterwards only runs builtins.match over the index instead of
+    evaluating nixpkgs again. supervise() restarts the repl when it dies,
+    stops answering or grows past max_rss_mb.
+    """
+    
+    SETUP = [
+        'pkgs = import <nixpkgs> {}',
+        'nixguiIndex = let lib = pkgs.lib; visit = path: set: lib.concatLists (lib.mapAttrsToList (n: v: '
+        'let r = builtins.tryEval (let x = if lib.isDerivation v then { drv = true; name = v.name; '
+        'version = v.version or ""; } else if builtins.isAttrs v && (v.recurseForDerivations or false) '
+        'then { drv = false; } else null; in builtins.deepSeq x x); in '
+        'if !r.success || r.value == null then [] else if r.value.drv then '
+        '[ { name = lib.concatStringsSep "." (path ++ [ n ]); value = { inherit (r.value) name version; }; } ] '
+        'else visit (path ++ [ n ]) v) set); in visit [ "nixpkgs" ] pkgs',
+        'nixguiSearch = pattern: builtins.toJSON (builtins.listToAttrs '
+        '(builtins.filter (p: builtins.match pattern (builtins.parseDrvName p.value.name).name != null) '
+        'nixguiIndex))',
+    ]
+    
+    def __init__(self, timeout=30, warm_timeout=600, max_rss_mb=4096):
+        self.timeout = timeout
+        self.warm_timeout = warm_timeout  # forcing the index evaluates all of nixpkgs
+        self.max_rss_mb = max_rss_mb
+        self.lock = threading.Lock()  # one expression at a time on the pipe
+        self.process = None
+        self.lines = queue.Queue()
+        self.sequence = 0
+        self.ready = False
+        self.restarts = 0
+        self.wake = threading.Event()  # set on restart so supervise() acts at once
+    
+    @staticmethod
+    def nix_string(value):
+        return '"' + value.replace('\\', '\\\\').replace('"', '\\"').replace('${', '\\${') + '"'
+    
+    @staticmethod
+    def parse_nix_string(text):
+        """Undo the escaping nix repl applies when it prints a string"""
+        text = text[text.index('"') + 1:text.rindex('"')]
+        escapes = {'n': '\n', 't': '\t', 'r': '\r'}
+        return re.sub(r'\\(.)', lambda m: escapes.get(m.group(1), m.group(1)), text, flags=re.DOTALL)
+    
+    def start(self):
+        print("🧠 Starting nix evaluator (nix repl)...")
+        self.process = subprocess.Popen(
+            ['nix', 'repl'],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            bufsize=1,
+            env={**os.environ, 'TERM': 'dumb', 'NO_COLOR': '1'}
+        )
+        self.lines = queue.Queue()
+        for stream, kind in ((self.process.stdout, 'out'), (self.process.stderr, 'err')):
+            threading.Thread(target=self.pump, args=(stream, kind, self.lines), daemon=True).start()
+        for line in self.SETUP:
+            self.process.stdin.write(line + '\n')
+        self.process.stdin.flush()
+        
+        # Force the whole index now, so searches never pay for it
+        started = time.time()
+        count = self.evaluate('builtins.toString (builtins.length nixguiIndex)', self.warm_timeout)
+        self.ready = True
+        print(f"🧠 Evaluator ready: {count} packages in {time.time() - started:.1f}s")
+    
+    @staticmethod
+    def pump(stream, kind, lines):
+        for line in stream:
+            lines.put((kind, line))
+        lines.put((kind, None))
+    
+    def stop(self):
+        self.ready = False
+        if self.process is not None:
+            self.process.kill()
+            self.process.wait()
+            self.process = None
+    
+    def restart(self, reason):
+        print(f"🔁 Restarting nix evaluator: {reason}")
+        metrics.inc('nixgui_evaluator_restarts_total', [('reason', reason)])
+        self.restarts += 1
+        self.stop()
+        self.wake.set()
+    
+    def evaluate(self, expression, timeout=None):
+        """Evaluate a string-valued Nix expression in the repl and return it"""
+        timeout = timeout or self.timeout
+        if not self.lock.acquire(timeout=timeout):
+            raise EvaluatorError('evaluator busy')
+        try:
+            if self.process is None:
+                raise EvaluatorError('evaluator not running')
+            if self.process.poll() is not None:
+                self.restart('exited')
+                raise EvaluatorError('evaluator exited')
+            # Output left over from an earlier expression that failed
+            while not self.lines.empty():
+                self.lines.get_nowait()
+            self.sequence += 1
+            marker = f'__nixgui_{self.sequence}__'
+            try:
+                self.process.stdin.write(f'{self.nix_string(marker)} + ({expression})\n')
+                self.process.stdin.flush()
+            except BrokenPipeError:
+                self.restart('exited')
+                raise EvaluatorError('evaluator exited')
+            
+            deadline = time.time() + timeout
+            while True:
+                try:
+                    kind, line = self.lines.get(timeout=max(deadline - time.time(), 0))
+                except queue.Empty:
+                    # Stuck evaluating; a fresh repl is cheaper than waiting
+                    self.restart('timeout')
+                    raise subprocess.TimeoutExpired(['nix', 'repl'], timeout)
+                if line is None:
+                    self.restart('exited')
+                    raise EvaluatorError('evaluator exited')
+                if kind == 'err' and line.lstrip().startswith('error'):
+                    raise EvaluatorError(line.strip())
+                if kind == 'out' and marker in line:
+                    return self.parse_nix_string(line)[len(marker):]
+        finally:
+            self.lock.release()
+    
+    def search(self, pattern):
+        """Packages whose name fully matches the regex, shaped like nix-env -qa --json"""
+        return json.loads(self.evaluate(f'nixguiSearch {self.nix_string(pattern)}'))
+    
+    def rss_mb(self):
+        try:
+            with open(f'/proc/{self.process.pid}/status') as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        return int(line.split()[1]) // 1024
+        except (OSError, AttributeError):
+            pass
+        return None
+    
+    def supervise(self):
+        """Keep one healthy, warm repl running; meant for a daemon thread"""
+        while True:
+            if self.process is not None and self.process.poll() is not None:
+                self.restart('exited')
+            if self.process is None:
+                try:
+                    self.start()
+                except (OSError, EvaluatorError, subprocess.TimeoutExpired) as e:
+                    print(f"⚠️  Nix evaluator unavailable, searches use nix-env: {str(e)[:200]}")
+                    self.stop()
+                    time.sleep(300)
+                    continue
+                self.wake.clear()
+            
+            self.wake.wait(30)
+            self.wake.clear()
+            if self.process is None or self.process.poll() is not None:
+                continue
+            rss = self.rss_mb()
+            if rss is not None and rss > self.max_rss_mb:
+                self.restart('memory')
+                continue
+            try:
+                self.evaluate('""', timeout=10)
+            except subprocess.TimeoutExpired:
+                pass  # evaluate() already restarted it
+            except EvaluatorError as e:
+                if str(e) != 'evaluator busy':
+                    self.restart('unhealthy')
+    
+    def status(self):
+        return {
+            'ready': self.ready,
+            'pid': self.process.pid if self.process else None,
+            'rssMb': self.rss_mb() if self.process else None,
+            'restarts': self.restarts
+        }
+
+class PackageSearch:
+    """Cached package search, shared by request handlers and the prewarmer
+    
+    Instances only carry per-call state: phase timings and the niceness
+    of the nix-env runs they start.
+    """
+    
+    # Class-level cache shared across all requests (SharedCache when pre-forked)
+    search_cache = MemoryCache()
     CACHE_TTL = 3600  # 1 hour for search results
-    INSTALLED_TTL = 300  # 5 minutes for installed packages
+    CLEAN_INTERVAL = 60  # seconds between sweeps for expired entries
+    last_cleaned = 0
     
-    def __init__(self, *args, **kwargs):
-        # Update installed packages cache if expired
-        if time.time() - self.installed_cache['timestamp'] > self.INSTALLED_TTL:
-            print("🔄 Refreshing installed packages cache...")
-            self.installed_cache['packages'] = self.get_installed_packages()
-            self.installed_cache['timestamp'] = time.time()
-        super().__init__(*args, **kwargs)
+    # Failed and timed-out searches are remembered briefly so retries are free
+    negative_cache = MemoryCache()
+    NEGATIVE_TTL = 60  # 1 minute for nix-env failures
+    TIMEOUT_TTL = 120  # 2 minutes for searches that hit the 30s timeout
+    
+    # Full package metadata for /package/<attr> and batch attribute lookups,
+    # keyed by attribute path
+    package_cache = MemoryCache()
+    PACKAGE_CACHE_SIZE = 1000
+    
+    # In-memory catalog for plain-name searches, loaded by the warm-up
+    catalog = None  # per process; every process maps the same file
+    
+    # Optional warm `nix repl` for misses the catalog cannot answer (--evaluator)
+    evaluator = None
+    
+    subprocess_niceness = 0  # request handlers run nix-env at normal priority
+    
+    # nix-env fails a whole run on the first selector it cannot find
+    NO_MATCH = re.compile(r"selector '(.*)' matches no derivations")
+    MISSING_ATTR = re.compile(r"attribute '.*' in selection path '(.*)' not found")
+    MAX_SELECTOR_RETRIES = 3
+    
+    def __init__(self, niceness=0):
+        self.timings = {}
+        self.subprocess_niceness = niceness
+    
+    @staticmethod
+    def normalize_query(query):
+        """Canonical form of a query: trimmed and single-spaced
+        
+        Case is kept; nix-env matches package names case-sensitively.
+        """
+        return ' '.join(query.split())
     
     @staticmethod
     def get_cache_key(query):
-        """Generate cache key for search query"""
+        """Generate cache key for a normalized search query"""
         return hashlib.md5(query.encode()).hexdigest()
     
+    @classmethod
+    def cache_negative(cls, cache_key, response, reason, ttl):
+        """Remember a failed search so retries don't re-run nix-env"""
+        cls.negative_cache[cache_key] = {
+            'data': response,
+            'timestamp': time.time(),
+            'ttl': ttl
+        }
+        metrics.inc('nixgui_negative_cache_stores_total', [('reason', reason)])
+        cls.maybe_clean_cache()
+    
+    @classmethod
+    def maybe_clean_cache(cls):
+        """Sweep expired entries, at most once per CLEAN_INTERVAL"""
+        if time.time() - PackageSearch.last_cleaned >= cls.CLEAN_INTERVAL:
+            cls.clean_cache()
+    
     @classmethod
     def clean_cache(cls):
         """Remove expired entries from cache"""
         current_time = time.time()
-        expired_keys = []
+        PackageSearch.last_cleaned = current_time
+        expired = cls.search_cache.expire(cls.CACHE_TTL, current_time)
+        metrics.inc('nixgui_cache_evictions_total', [('reason', 'expired')], expired)
+        cls.negative_cache.expire(cls.NEGATIVE_TTL, current_time)
+        cls.package_cache.expire(cls.CACHE_TTL, current_time)
+        size = len(cls.package_cache)
+        if size > cls.PACKAGE_CACHE_SIZE:
+            # Still too big: drop the oldest half
+            cls.package_cache.evict_oldest(size // 2)
         
-        for key, entry in cls.search_cache.items():
-            if current_time - entry['timestamp'] > cls.CACHE_TTL:
-                expired_keys.append(key)
+        if expired:
+            print(f"🧹 Cleaned {expired} expired cache entries")
+    
+    @contextmanager
+    def timed(self, phase):
+        """Accumulate wall time spent in a request phase"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[phase] = self.timings.get(phase, 0) + time.perf_counter() - start
+    
+    def lookup_cached(self, cache_key, query):
+        """Return a cached response (positive or negative) for a query, or None"""
+        cache_entry = self.search_cache.get(cache_key)
+        if cache_entry and time.time() - cache_entry['timestamp'] < self.CACHE_TTL:
+            print(f"💾 Cache HIT for '{query}'")
+            metrics.inc('nixgui_cache_hits_total')
+            response = cache_entry['data'].copy()
+            response['cached'] = True
+            return response
         
-        for key in expired_keys:
-            del cls.search_cache[key]
+        # Then the short-lived cache of failures and timeouts
+        cache_entry = self.negative_cache.get(cache_key)
+        if cache_entry and time.time() - cache_entry['timestamp'] < cache_entry['ttl']:
+            print(f"🚫 Negative cache HIT for '{query}'")
+            metrics.inc('nixgui_negative_cache_hits_total')
+            response = cache_entry['data'].copy()
+            response['cached'] = True
+            return response
         
-        if expired_keys:
-            print(f"🧹 Cleaned {len(expired_keys)} expired cache entries")
+        return None
+    
+    def run_nix_env(self, args, command='nix-env -qa'):
+        """Run nix-env with the standard 30s timeout, counting and timing it"""
+        metrics.inc('nixgui_subprocess_total', [('command', command)])
+        # nice(1) rather than preexec_fn, which can deadlock a threaded server
+        nice = ['nice', '-n', str(self.subprocess_niceness)] if self.subprocess_niceness else []
+        try:
+            with self.timed('subprocess'):
+                result = subprocess.run(
+                    nice + ['nix-env'] + args,
+                    capture_output=True,
+                    text=True,
+                    timeout=30
+                )
+        except subprocess.TimeoutExpired:
+            metrics.inc('nixgui_subprocess_failures_total', [('command', command)])
+            raise
+        if result.returncode != 0:
+            metrics.inc('nixgui_subprocess_failures_total', [('command', command)])
+        return result
+    
+    def run_selectors(self, args, selectors, unknown, command='nix-env -qa'):
+        """Run nix-env on several selectors, leaving out the ones it can't find
+        
+        A selector named by the `unknown` error is dropped and the rest are
+        run again, up to MAX_SELECTOR_RETRIES times. Returns the last result
+        and the dropped selectors.
+        """
+        selectors = list(selectors)
+        dropped = []
+        for _ in range(self.MAX_SELECTOR_RETRIES + 1):
+            result = self.run_nix_env(args + selectors, command)
+            match = unknown.search(result.stderr) if result.returncode != 0 else None
+            if not match or match.group(1) not in selectors:
+                break
+            selectors.remove(match.group(1))
+            dropped.append(match.group(1))
+            if not selectors:
+                break
+        return result, dropped
     
     @staticmethod
-    def get_installed_packages():
-        """Get list of installed package names - handles multiple scenarios"""
-        installed = set()
+    def is_installed(name, installed_packages):
+        """Heuristic match of a package name against the installed set"""
+        if name.startswith('nixpkgs.'):
+            name = name[len('nixpkgs.'):]  # attribute paths carry the channel
+        base_name = name.split('-')[0]
+        return (
+            name in installed_packages or
+            base_name in installed_packages or
+            any(inst.startswith(base_name) for inst in installed_packages)
+        )
+    
+    @classmethod
+    def describe_license(cls, license):
+        """meta.license may be a string, an attrset or a list of either"""
+        if isinstance(license, list):
+            return ', '.join(filter(None, map(cls.describe_license, license)))
+        if isinstance(license, dict):
+            return license.get('spdxId') or license.get('fullName') or license.get('shortName')
+        return license
+    
+    def format_package(self, name, info, installed_packages):
+        """Everything we know about a package; /search trims this with project()"""
+        meta = info.get('meta', {})
+        return {
+            'name': name,
+            'version': info.get('version', 'unknown'),
+            'installed': bool(installed_packages) and self.is_installed(name, installed_packages),
+            'hasInstalledData': bool(installed_packages),
+            'pname': info.get('pname'),
+            'description': meta.get('description', 'No description'),
+            'longDescription': meta.get('longDescription'),
+            'homepage': meta.get('homepage'),
+            'license': self.describe_license(meta.get('license')),
+            'platforms': meta.get('platforms'),
+            'broken': meta.get('broken', False),
+            'unfree': meta.get('unfree', False)
+        }
+    
+    def build_response(self, cache_key, query, packages, total=None):
+        """Format parsed nix-env output as a /search response and cache it
         
-        # Method 1: Try nix profile list (newer Nix)
+        Installed status is left out here and added per profile by
+        annotate_response(), so one cached response serves every profile.
+        """
+        with self.timed('parse'):
+            formatted_results = [
+                self.format_package(name, info, set())
+                for name, info in list(packages.items())[:50]
+            ]
+        
+        response = {
+            'results': formatted_results,
+            'error': None,
+            'total': len(packages) if total is None else total,
+            'cached': False
+        }
+        
+        # Cache the response
+        self.search_cache[cache_key] = {
+            'data': response,
+            'timestamp': time.time()
+        }
+        print(f"💾 Cached results for '{query}'")
+        
+        # Clean old cache entries periodically
+        self.maybe_clean_cache()
+        
+        return response
+    
+    def search(self, query):
+        """Answer one normalized query from the caches or a nix-env run"""
+        cache_key = self.get_cache_key(query)
+        response = self.lookup_cached(cache_key, query)
+        if response is not None:
+            return response
+        
+        metrics.inc('nixgui_cache_misses_total')
+        
+        # Fast path once the catalog is loaded; nix-env until then
+        catalog = self.catalog
+        if catalog is not None and Catalog.can_answer(query):
+            with self.timed('index'):
+                packages, total = catalog.search(query)
+            metrics.inc('nixgui_catalog_searches_total')
+            return self.build_response(cache_key, query, packages, total)
+        
+        try:
+            # The warm evaluator only has to match names; nix-env if it can't
+            evaluator = self.evaluator
+            if evaluator is not None and evaluator.ready:
+                try:
+                    with self.timed('evaluator'):
+                        packages = evaluator.search(f'.*{query}.*')
+                    metrics.inc('nixgui_evaluator_queries_total')
+                    return self.build_response(cache_key, query, packages)
+                except (EvaluatorError, subprocess.TimeoutExpired) as e:
+                    # A stuck repl is restarted; nix-env may still answer in time
+                    print(f"  ⚠️  Evaluator failed for '{query}' ({str(e)[:80]}), using nix-env")
+            
+            # Run nix search with timeout
+            print(f"🔍 Searching for '{query}'...")
+            result, dropped = self.run_selectors(['-qa', '--json'], [f'.*{query}.*'], self.NO_MATCH)
+            if dropped:
+                return self.build_response(cache_key, query, {})
+            
+            if result.returncode != 0:
+                response = {
+                    'results': [],
+                    'error': f'Search failed: {result.stderr[:200]}',
+                    'cached': False
+                }
+                self.cache_negative(cache_key, response, 'failed', self.NEGATIVE_TTL)
+                return response
+            
+            # Parse results
+            try:
+                with self.timed('parse'):
+                    packages = json.loads(result.stdout)
+            except json.JSONDecodeError:
+                response = {
+                    'results': [],
+                    'error': 'Invalid response from nix-env',
+                    'cached': False
+                }
+                self.cache_negative(cache_key, response, 'invalid', self.NEGATIVE_TTL)
+                return response
+            
+            return self.build_response(cache_key, query, packages)
+            
+        except subprocess.TimeoutExpired:
+            response = {
+                'results': [],
+                'error': 'Search timed out. Try a more specific query.',
+                'cached': False
+            }
+            self.cache_negative(cache_key, response, 'timeout', self.TIMEOUT_TTL)
+            return response
+        except Exception as e:
+            return {
+                'results': [],
+                'error': f'Server error: {str(e)}',
+                'cached': False
+            }
+    
+    def search_batch(self, queries):
+        """Answer many normalized queries with at most one nix-env evaluation"""
+        responses = {}
+        misses = {}
+        for query in queries:
+            cache_key = self.get_cache_key(query)
+            response = self.lookup_cached(cache_key, query)
+            if response is not None:
+                responses[query] = response
+            else:
+                metrics.inc('nixgui_cache_misses_total')
+                misses[query] = cache_key
+        
+        responses.update(self.search_misses(misses))
+        return responses
+    
+    def search_misses(self, misses):
+        """Search queries known to be uncached (query -> cache key) and cache them"""
+        responses = {}
+        catalog = self.catalog
+        if catalog is not None:
+            for query in [q for q in misses if Catalog.can_answer(q)]:
+                with self.timed('index'):
+                    packages, total = catalog.search(query)
+                metrics.inc('nixgui_catalog_searches_total')
+                responses[query] = self.build_response(misses.pop(query), query, packages, total)
+        
+        evaluator = self.evaluator
+        if evaluator is not None and evaluator.ready:
+            for query in list(misses):
+                try:
+                    with self.timed('evaluator'):
+                        packages = evaluator.search(f'.*{query}.*')
+                except (EvaluatorError, subprocess.TimeoutExpired):
+                    break  # leave the rest to nix-env
+                metrics.inc('nixgui_evaluator_queries_total')
+                responses[query] = self.build_response(misses.pop(query), query, packages)
+        
+        if not misses:
+            return responses
+        
+        # Patterns are needed to split the results below, and one invalid
+        # pattern would fail the whole run, so weed those out first (a single
+        # query needs no splitting and is left for nix-env to judge)
+        patterns = {}
+        if len(misses) > 1:
+            for query in list(misses):
+                try:
+                    patterns[query] = re.compile(f'.*{query}.*')
+                except re.error as e:
+                    response = {
+                        'results': [],
+                        'error': f'Invalid search pattern: {e}',
+                        'cached': False
+                    }
+                    self.cache_negative(misses.pop(query), response, 'invalid', self.NEGATIVE_TTL)
+                    responses[query] = response
+        if not misses:
+            return responses
+        
+        # nix-env -qa accepts several patterns and returns the union, so one
+        # evaluation covers every miss; results are split per query below
+        print(f"🔍 Batch searching {len(misses)} queries...")
+        selectors = {f'.*{q}.*': q for q in misses}
+        try:
+            result, dropped = self.run_selectors(['-qa', '--json'], selectors, self.NO_MATCH)
+        except subprocess.TimeoutExpired:
+            for query, cache_key in misses.items():
+                response = {
+                    'results': [],
+                    'error': 'Search timed out. Try a more specific query.',
+                    'cached': False
+                }
+                self.cache_negative(cache_key, response, 'timeout', self.TIMEOUT_TTL)
+                responses[query] = response
+            return responses
+        
+        # A query nothing matches has no results, not a failed search
+        for selector in dropped:
+            query = selectors[selector]
+            responses[query] = self.build_response(misses.pop(query), query, {})
+        if not misses:
+            return responses
+        
+        try:
+            if result.returncode != 0:
+                raise ValueError(f'Search failed: {result.stderr[:200]}')
+            with self.timed('parse'):
+                packages = json.loads(result.stdout)
+        except ValueError as e:
+            # json.JSONDecodeError is a ValueError too
+            error = str(e) if result.returncode != 0 else 'Invalid response from nix-env'
+            for query, cache_key in misses.items():
+                response = {'results': [], 'error': error, 'cached': False}
+                self.cache_negative(cache_key, response, 'failed', self.NEGATIVE_TTL)
+                responses[query] = response
+            return responses
+        
+        for query, cache_key in misses.items():
+            if len(misses) == 1:
+                matches = packages
+            else:
+                matches = {
+                    name: info for name, info in packages.items()
+                    if patterns[query].fullmatch(Catalog.package_name(info.get('name', name)))
+                }
+            responses[query] = self.build_response(cache_key, query, matches)
+        return responses
+    
+    def resolve_attrs(self, attrs):
+        """Look up exact attribute paths, from package_cache or a nix-env -qaA run"""
+        found = {}
+        missing = []
+        for attr in attrs:
+            cache_entry = self.package_cache.get(attr)
+            if cache_entry and time.time() - cache_entry['timestamp'] < cache_entry.get('ttl', self.CACHE_TTL):
+                metrics.inc('nixgui_package_cache_hits_total')
+                found[attr] = cache_entry['data']
+            else:
+                metrics.inc('nixgui_package_cache_misses_total')
+                missing.append(attr)
+        
+        if not missing:
+            return found
+        
+        # One unknown attribute fails the whole run; run_selectors drops it
+        result, dropped = self.run_selectors(['-qa', '--json', '--meta', '-A'], missing,
+                                             self.MISSING_ATTR, command='nix-env -qaA')
+        # Unknown attributes are remembered briefly; a channel update may add them
+        for attr in dropped:
+            self.package_cache[attr] = {'data': None, 'timestamp': time.time(), 'ttl': self.NEGATIVE_TTL}
+            found[attr] = None
+        remaining = [attr for attr in missing if attr not in dropped]
+        if not remaining:
+            return found
+        if result.returncode != 0:
+            # Nothing is cached, so a transient failure can't hide a real package
+            raise RuntimeError(f'nix-env -qaA failed: {result.stderr[:200]}')
+        
+        with self.timed('parse'):
+            packages = json.loads(result.stdout)
+        for attr in remaining:
+            info = packages.get(attr)
+            if info:
+                package = self.format_package(attr, info, set())
+                self.package_cache[attr] = {'data': package, 'timestamp': time.time()}
+            else:
+                package = None
+                self.package_cache[attr] = {'data': None, 'timestamp': time.time(), 'ttl': self.NEGATIVE_TTL}
+            found[attr] = package
+        self.maybe_clean_cache()
+        return found
+
+class CachedPackageSearchHandler(BaseHTTPRequestHandler, PackageSearch):
+    # Keep-alive for debounced searches; idle connections close after timeout seconds
+    protocol_version = 'HTTP/1.1'
+    timeout = 15
+    disable_nagle_algorithm = True
+    
+    installed_cache = {'packages': set(), 'timestamp': 0}
+    INSTALLED_TTL = 300  # 5 minutes for installed packages
+    INSTALLED_PROBE_TIMEOUT = 60  # a probe lease older than this was abandoned
+    
+    # Installed snapshots for profile= on /search; installed_cache stays the
+    # default (first profile that answers). Cached results carry no installed
+    # flags, so every profile shares them and is annotated on the way out.
+    PROFILES = {
+        'user': os.path.expanduser('~/.nix-profile'),
+        'system': '/nix/var/nix/profiles/system'
+    }
+    # Other profile= paths must live here or link into the store
+    PROFILE_DIRS = (
+        '/nix/var/nix/profiles',
+        os.path.expanduser('~/.local/state/nix/profiles')
+    )
+    profile_cache = {}  # profile name or path -> {'packages', 'timestamp', 'target'}
+    MAX_PROFILES = 32
+    
+    MAX_BATCH = 100  # queries + attributes per batch request
+    MAX_BODY = 64 * 1024
+    
+    # /search returns only these per result unless fields= asks for more
+    LIST_FIELDS = ('name', 'version', 'installed', 'hasInstalledData')
+    DETAIL_FIELDS = ('pname', 'description', 'longDescription', 'homepage', 'license',
+                     'platforms', 'broken', 'unfree')
+    
+    # Endpoints reported individually in metrics; anything else is 'other'
+    METRIC_PATHS = ('/search', '/search/batch', '/health', '/cache/stats', '/cache/clear',
+                    '/debug', '/metrics')
+    
+    # Background warm-up: installed detection, then the in-memory catalog
+    # that answers plain-name searches without running nix-env
+    CATALOG_PATH = os.path.join(CACHE_DIR, 'catalog.tsv')
+    CATALOG_TTL = 24 * 3600  # re-evaluate nixpkgs once a day
+    CATALOG_TIMEOUT = 600  # a full nix-env -qa is much slower than a search
+    CATALOG_RETRY = 300  # after a failed load, keep using nix-env this long
+    WARMUP_TIMINGS_PATH = os.path.join(CACHE_DIR, 'warmup.json')
+    WARMUP_PHASES = (('installed', 10), ('catalog', 80), ('index', 10))  # % of warm-up
+    warmup_store = {}  # phase and loader lease, shared between workers
+    installed_refresh_lock = threading.Lock()
+    
+    # Frequent queries are logged and replayed into search_cache after a
+    # restart, a /cache/clear or a catalog rebuild
+    query_log = QueryLog(os.path.join(CACHE_DIR, 'queries.json'))
+    PREWARM_COUNT = int(os.environ.get('NIXGUI_PREWARM', '200'))  # top queries to prewarm; 0 disables
+    PREWARM_BATCH = 25  # queries per nix-env run while prewarming
+    PREWARM_PAUSE = 0.5  # seconds between batches, to leave room for live requests
+    PREWARM_NICENESS = 10  # nix-env runs for prewarming yield the CPU
+    prewarm_requested = threading.Event()
+    
+    # Set by use_shared_store() when running with several worker processes
+    workers = 1
+    metrics_store = None
+    METRICS_FLUSH_INTERVAL = 1  # seconds between worker metric snapshots
+    
+    def __init__(self, request, client_address, server):
+        # Time from accept() to the first request of a connection counts as
+        # queue wait: thread start-up plus reading the request line and headers
+        self.accepted_at = getattr(server, 'accepted_at', {}).pop(request, None)
+        self.timings = {}
+        # Refresh installed packages in the background if expired; requests
+        # keep using the previous snapshot meanwhile
+        if time.time() - self.installed_cache['timestamp'] > self.INSTALLED_TTL:
+            threading.Thread(target=self.refresh_installed, daemon=True).start()
+        super().__init__(request, client_address, server)
+    
+    @classmethod
+    def refresh_installed(cls):
+        """Re-detect installed packages unless another thread or worker is"""
+        if not cls.installed_refresh_lock.acquire(blocking=False):
+            return
+        try:
+            if time.time() - cls.installed_cache['timestamp'] <= cls.INSTALLED_TTL:
+                return
+            # Only one worker probes, like the catalog loader in ensure_catalog()
+            lease = {'pid': os.getpid(), 'at': time.time()}
+            held = cls.warmup_store.get('installed_lease')
+            if held and time.time() - held['at'] > cls.INSTALLED_PROBE_TIMEOUT:
+                cls.warmup_store.pop('installed_lease', None)  # its prober died
+            if cls.warmup_store.setdefault('installed_lease', lease) != lease:
+                return
+            try:
+                # Another worker may have finished just before we took the lease
+                if time.time() - cls.installed_cache['timestamp'] <= cls.INSTALLED_TTL:
+                    return
+                print("🔄 Refreshing installed packages cache...")
+                cls.installed_cache['packages'] = cls.get_installed_packages()
+                cls.installed_cache['timestamp'] = time.time()
+            finally:
+                cls.warmup_store.pop('installed_lease', None)
+        finally:
+            cls.installed_refresh_lock.release()
+    
+    @classmethod
+    def start_warmup(cls):
+        threading.Thread(target=cls.warm_up, daemon=True).start()
+        if cls.evaluator is not None:
+            threading.Thread(target=cls.evaluator.supervise, daemon=True).start()
+    
+    @classmethod
+    def warm_up(cls):
+        """Startup work that used to block serving, run in the background"""
+        cls.set_phase('installed')
+        started = time.time()
+        cls.refresh_installed()
+        cls.record_timing('installed', time.time() - started)
+        
+        # One worker prewarms the shared cache after startup
+        if cls.warmup_store.setdefault('prewarm', os.getpid()) == os.getpid():
+            cls.prewarm_requested.set()
+        next_catalog_check = 0
+        while True:
+            if time.time() >= next_catalog_check:
+                try:
+                    if cls.ensure_catalog():
+                        # Results from the previous catalog may be out of date
+                        cls.search_cache.clear()
+                        cls.negative_cache.clear()
+                        cls.prewarm_requested.set()
+                    next_catalog_check = time.time() + 60
+                except Exception as e:
+                    print(f"⚠️  Catalog unavailable, searches use nix-env: {str(e)[:200]}")
+                    cls.set_phase('failed', error=str(e)[:200])
+                    next_catalog_check = time.time() + cls.CATALOG_RETRY
+            
+            if cls.prewarm_requested.is_set():
+                cls.prewarm_requested.clear()
+                try:
+                    cls.prewarm()
+                except Exception as e:
+                    print(f"⚠️  Prewarming stopped: {str(e)[:200]}")
+            try:
+                cls.query_log.flush()
+            except OSError as e:
+                print(f"⚠️  Could not save the query log: {e}")
+            cls.prewarm_requested.wait(60)
+    
+    @classmethod
+    def ensure_catalog(cls):
+        """Map the catalog file, (re)building it first if missing or stale
+        
+        Returns True if this process replaced an existing catalog.
+        """
+        path = cls.CATALOG_PATH
+        mtime = os.path.getmtime(path) if os.path.exists(path) else None
+        
+        # Any catalog beats none: map a stale one while a fresh one is built
+        if mtime is not None and (cls.catalog is None or cls.catalog.mtime != mtime):
+            cls.map_catalog(path)
+        if mtime is not None and time.time() - mtime < cls.CATALOG_TTL:
+            return False
+        
+        # Only one process evaluates nixpkgs; the others wait for its file
+        lease = {'pid': os.getpid(), 'at': time.time()}
+        held = cls.warmup_store.get('lease')
+        if held and time.time() - held['at'] > cls.CATALOG_TIMEOUT:
+            cls.warmup_store.pop('lease', None)  # its loader died
+        if cls.warmup_store.setdefault('lease', lease) == lease:
+            try:
+                cls.load_catalog(path)
+            finally:
+                cls.warmup_store.pop('lease', None)
+            cls.map_catalog(path)
+            return mtime is not None
+        
+        deadline = time.time() + cls.CATALOG_TIMEOUT
+        while time.time() < deadline and 'lease' in cls.warmup_store:
+            time.sleep(1)
+        cls.map_catalog(path)
+        return False
+    
+    @classmethod
+    def load_catalog(cls, path):
+        """Evaluate all of nixpkgs once and write it as a catalog file"""
+        cls.set_phase('catalog')
+        print("📚 Loading the package catalog (nix-env -qa)...")
+        started = time.time()
+        metrics.inc('nixgui_subprocess_total', [('command', 'nix-env -qa (catalog)')])
+        result = subprocess.run(
+            ['nix-env', '-qa', '--json'],
+            capture_output=True,
+            text=True,
+            timeout=cls.CATALOG_TIMEOUT
+        )
+        if result.returncode != 0:
+            metrics.inc('nixgui_subprocess_failures_total', [('command', 'nix-env -qa (catalog)')])
+            raise RuntimeError(f'nix-env -qa failed: {result.stderr[:200]}')
+        packages = json.loads(result.stdout)
+        cls.record_timing('catalog', time.time() - started)
+        
+        cls.set_phase('index')
+        started = time.time()
+        Catalog.write(path, packages)
+        cls.record_timing('index', time.time() - started)
+        print(f"📚 Catalog ready: {len(packages)} packages")
+    
+    @classmethod
+    def map_catalog(cls, path):
+        # The old map is left to the garbage collector; a search may still use it
+        PackageSearch.catalog = Catalog(path)
+        cls.set_phase('ready', packages=cls.catalog.count)
+    
+    @classmethod
+    def prewarm(cls):
+        """Search the most frequent logged queries that are not cached yet"""
+        now = time.time()
+        queries = []
+        for query in cls.query_log.top(cls.PREWARM_COUNT):
+            entry = cls.search_cache.get(cls.get_cache_key(query))
+            if not entry or now - entry['timestamp'] >= cls.CACHE_TTL:
+                queries.append(query)
+        if not queries:
+            return
+        
+        print(f"🔥 Prewarming {len(queries)} frequent queries...")
+        searcher = PackageSearch(niceness=cls.PREWARM_NICENESS)
+        for i in range(0, len(queries), cls.PREWARM_BATCH):
+            batch = queries[i:i + cls.PREWARM_BATCH]
+            searcher.search_misses({query: cls.get_cache_key(query) for query in batch})
+            metrics.inc('nixgui_prewarmed_queries_total', value=len(batch))
+            time.sleep(cls.PREWARM_PAUSE)
+        print(f"🔥 Prewarmed {len(queries)} queries in {time.time() - now:.1f}s")
+    
+    @classmethod
+    def set_phase(cls, phase, **extra):
+        state = cls.warmup_store.get('state') or {'startedAt': time.time()}
+        if state.get('phase') == 'ready' and phase == 'installed':
+            return  # another worker is already warm
+        cls.warmup_store['state'] = {
+            'phase': phase,
+            'startedAt': state['startedAt'],
+            'phaseStartedAt': time.time(),
+            **extra
+        }
+    
+    @classmethod
+    def record_timing(cls, phase, seconds):
+        """Remember how long a phase took, to estimate the next warm-up"""
+        try:
+            with open(cls.WARMUP_TIMINGS_PATH) as f:
+                timings = json.load(f)
+        except (OSError, ValueError):
+            timings = {}
+        timings[phase] = round(seconds, 3)
+        try:
+            os.makedirs(os.path.dirname(cls.WARMUP_TIMINGS_PATH), exist_ok=True)
+            with open(cls.WARMUP_TIMINGS_PATH, 'w') as f:
+                json.dump(timings, f)
+        except OSError:
+            pass
+    
+    @classmethod
+    def warmup_progress(cls):
+        """Phase, percent and ETA of the warm-up, for /health"""
+        state = cls.warmup_store.get('state') or {'phase': 'starting', 'startedAt': time.time(),
+                                                 'phaseStartedAt': time.time()}
+        progress = {'phase': state['phase'], 'elapsed': round(time.time() - state['startedAt'], 1)}
+        if cls.catalog is not None:
+            return {**progress, 'phase': 'ready', 'percent': 100, 'eta': 0}
+        if state['phase'] == 'failed':
+            return {**progress, 'percent': None, 'eta': None, 'error': state.get('error')}
+        
+        try:
+            with open(cls.WARMUP_TIMINGS_PATH) as f:
+                expected = json.load(f)
+        except (OSError, ValueError):
+            expected = {}
+        
+        # Before the first phase starts, every phase is still ahead
+        percent, eta = 0.0, 0.0
+        current_seen = state['phase'] not in dict(cls.WARMUP_PHASES)
+        in_phase = time.time() - state['phaseStartedAt']
+        for phase, weight in cls.WARMUP_PHASES:
+            if phase == state['phase']:
+                current_seen = True
+                if phase in expected:
+                    percent += weight * min(in_phase / max(expected[phase], 0.001), 0.95)
+                    eta += max(expected[phase] - in_phase, 0)
+                else:
+                    eta = None
+            elif not current_seen:
+                percent += weight
+            elif eta is not None:
+                eta = eta + expected[phase] if phase in expected else None
+        return {**progress, 'percent': round(percent), 'eta': round(eta, 1) if eta is not None else None}
+    
+    @classmethod
+    def use_shared_store(cls, path, workers):
+        """Swap the per-process caches for ones in a SQLite file"""
+        cls.workers = workers
+        PackageSearch.search_cache = SharedCache(path, 'search')
+        PackageSearch.negative_cache = SharedCache(path, 'negative')
+        PackageSearch.package_cache = SharedCache(path, 'package')
+        cls.installed_cache = SharedCache(path, 'installed', decoders={'packages': set})
+        cls.profile_cache = SharedCache(path, 'profiles')
+        cls.metrics_store = SharedCache(path, 'metrics')
+        cls.warmup_store = SharedCache(path, 'warmup')
+        if 'timestamp' not in cls.installed_cache:
+            cls.installed_cache['packages'] = set()
+            cls.installed_cache['timestamp'] = 0
+    
+    @classmethod
+    def flush_metrics(cls):
+        """Publish this worker's metrics for whichever worker serves /metrics"""
+        if cls.metrics_store is not None:
+            cls.metrics_store[str(os.getpid())] = metrics.snapshot()
+    
+    @classmethod
+    def all_metrics(cls):
+        if cls.metrics_store is None:
+            return metrics
+        cls.flush_metrics()
+        return Metrics.merged(cls.metrics_store.values())
+    
+    @staticmethod
+    def read_nix_profile(profile=None):
+        """Names from `nix profile list`, or None if that does not work"""
         try:
-            print("  Trying 'nix profile list'...")
+            metrics.inc('nixgui_subprocess_total', [('command', 'nix profile list')])
             result = subprocess.run(
-                ['nix', 'profile', 'list'],
+                ['nix', 'profile', 'list'] + (['--profile', profile] if profile else []),
                 capture_output=True,
                 text=True,
                 timeout=10,
@@ -67,6 +1385,7 @@ class CachedPackageSearchHandler(BaseHTTPRequestHandler):
             )
             
             if result.returncode == 0:
+                installed = set()
                 for line in result.stdout.split('\n'):
                     if line.startswith('Name:'):
                         # Remove ANSI color codes
@@ -75,199 +1394,427 @@ class CachedPackageSearchHandler(BaseHTTPRequestHandler):
                         name = name.replace('Name:', '').strip()
                         if name:
                             installed.add(name)
-                print(f"  ✅ Found {len(installed)} packages via 'nix profile'")
                 return installed
-            else:
-                print(f"  ❌ 'nix profile list' failed: {result.stderr[:100]}")
+            print(f"  ❌ 'nix profile list' failed: {result.stderr[:100]}")
         except Exception as e:
             print(f"  ❌ Error with 'nix profile': {str(e)}")
-        
-        # Method 2: Try nix-env -q (older Nix)
+        return None
+    
+    @staticmethod
+    def read_nix_env(profile=None):
+        """Package names from `nix-env -q`, or None if it fails or is empty"""
         try:
-            print("  Trying 'nix-env -q'...")
+            metrics.inc('nixgui_subprocess_total', [('command', 'nix-env -q')])
             result = subprocess.run(
-                ['nix-env', '-q'],
+                ['nix-env', '-q'] + (['--profile', profile] if profile else []),
                 capture_output=True,
                 text=True,
                 timeout=10
             )
             
             if result.returncode == 0 and result.stdout.strip():
+                installed = set()
                 for line in result.stdout.split('\n'):
                     if line.strip():
                         # Extract package name (before version)
                         parts = line.strip().split('-')
                         if parts:
                             installed.add(parts[0])
-                print(f"  ✅ Found {len(installed)} packages via 'nix-env'")
                 return installed
-            else:
-                print(f"  ❌ 'nix-env -q' failed or empty")
+            print(f"  ❌ 'nix-env -q' failed or empty")
         except Exception as e:
             print(f"  ❌ Error with 'nix-env': {str(e)}")
+        return None
+    
+    @classmethod
+    def get_installed_packages(cls):
+        """Get list of installed package names - handles multiple scenarios"""
+        # Method 1: Try nix profile list (newer Nix)
+        print("  Trying 'nix profile list'...")
+        installed = cls.read_nix_profile()
+        if installed is not None:
+            print(f"  ✅ Found {len(installed)} packages via 'nix profile'")
+            return installed
+        
+        # Method 2: Try nix-env -q (older Nix)
+        print("  Trying 'nix-env -q'...")
+        installed = cls.read_nix_env()
+        if installed is not None:
+            print(f"  ✅ Found {len(installed)} packages via 'nix-env'")
+            return installed
         
         # Method 3: Check system profile
-        try:
-            print("  Trying system profile...")
-            result = subprocess.run(
-                ['nix-env', '-q', '--profile', '/nix/var/nix/profiles/system'],
-                capture_output=True,
-                text=True,
-                timeout=10
-            )
-            
-            if result.returncode == 0 and result.stdout.strip():
-                for line in result.stdout.split('\n'):
-                    if line.strip():
-                        parts = line.strip().split('-')
-                        if parts:
-                            installed.add(parts[0])
-                print(f"  ✅ Found {len(installed)} system packages")
-                return installed
-        except Exception as e:
-            print(f"  ❌ Error with system profile: {str(e)}")
+        print("  Trying system profile...")
+        installed = cls.read_nix_env(cls.PROFILES['system'])
+        if installed is not None:
+            print(f"  ✅ Found {len(installed)} system packages")
+            return installed
         
         print("  ⚠️  Could not determine installed packages - feature disabled")
         return set()
     
-    def do_GET(self):
-        # Parse URL
-        parsed_path = urlparse(self.path)
+    @classmethod
+    def read_profile(cls, profile, path):
+        """Installed names in one profile, or None if it cannot be read"""
+        if profile == 'user':
+            installed = cls.read_nix_profile()
+            if installed is None:
+                installed = cls.read_nix_env()
+        else:
+            # nix-env reads classic profiles, `nix profile` the newer ones
+            installed = cls.read_nix_env(path)
+            if installed is None:
+                installed = cls.read_nix_profile(path)
+        if installed is not None:
+            print(f"  ✅ Profile '{profile}': {len(installed)} packages")
+        return installed
+    
+    @classmethod
+    def resolve_profile(cls, profile):
+        """Validate a profile= value; None means the default snapshot"""
+        if not profile or profile == 'auto':
+            return None
+        if profile in cls.PROFILES:
+            return profile
+        if os.path.isabs(profile):
+            # A profile is a symlink into the store, usually kept in a profiles
+            # directory; anything else would just cost a failing nix-env run
+            path = os.path.normpath(profile)
+            in_store = os.path.islink(path) and os.path.realpath(path).startswith('/nix/store/')
+            in_profiles = any(path.startswith(d + os.sep) for d in cls.PROFILE_DIRS)
+            if (in_store or in_profiles) and os.path.exists(path):
+                return path
+        raise ValueError(f"Unknown profile '{profile}': use auto, user, system or a Nix profile path")
+    
+    @classmethod
+    def installed_for(cls, profile):
+        """Installed snapshot for a resolved profile, refreshing it if needed
+        
+        Snapshots are refreshed when they expire or when the profile link
+        points at a new generation, so installs show up right away.
+        """
+        if profile is None:
+            return cls.installed_cache['packages']
         
-        # Enable CORS
-        self.send_response(200)
-        self.send_header('Content-Type', 'application/json')
+        path = cls.PROFILES.get(profile, profile)
+        target = os.path.realpath(path)
+        snapshot = cls.profile_cache.get(profile)
+        if snapshot is None:
+            # First use of this profile: read it now, there is nothing to show yet
+            snapshot = cls.refresh_profile(profile, path, target)
+        elif time.time() - snapshot['timestamp'] > cls.INSTALLED_TTL or snapshot['target'] != target:
+            # Claim the refresh, then serve the old snapshot meanwhile
+            cls.profile_cache[profile] = {**snapshot, 'timestamp': time.time(), 'target': target}
+            threading.Thread(target=cls.refresh_profile, args=(profile, path, target), daemon=True).start()
+        return set(snapshot['packages'])
+    
+    @classmethod
+    def refresh_profile(cls, profile, path, target):
+        print(f"🔄 Reading installed packages of profile '{profile}'...")
+        packages = cls.read_profile(profile, path)
+        if packages is None:
+            # Not cached, so a broken profile can't push out working ones;
+            # a background refresh keeps the previous snapshot
+            return {'packages': set(), 'timestamp': time.time(), 'target': target}
+        snapshot = {'packages': packages, 'timestamp': time.time(), 'target': target}
+        if profile not in cls.profile_cache and len(cls.profile_cache) >= cls.MAX_PROFILES:
+            oldest = min(cls.profile_cache.items(), key=lambda item: item[1]['timestamp'])[0]
+            cls.profile_cache.pop(oldest, None)
+        cls.profile_cache[profile] = snapshot
+        return snapshot
+    
+    def send_json(self, data, status=200):
+        """Send a JSON response with Content-Length so keep-alive framing works"""
+        with self.timed('serialize'):
+            body = json.dumps(data).encode()
+        self.send_body(body, 'application/json', status)
+    
+    def send_body(self, body, content_type, status=200):
+        """Write a complete response and record its timings"""
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
         self.send_header('Access-Control-Allow-Origin', '*')
+        if self.timings:
+            self.send_header('Server-Timing', ', '.join(
+                f'{phase};dur={seconds * 1000:.1f}' for phase, seconds in self.timings.items()))
+        if not self.close_connection:
+            self.send_header('Keep-Alive', f'timeout={self.timeout}')
         self.end_headers()
+        with self.timed('write'):
+            self.wfile.write(body)
+        self.record_request_metrics()
+    
+    def record_request_metrics(self):
+        path = urlparse(self.path).path
+        if path.startswith('/package/'):
+            path = '/package'
+        elif path not in self.METRIC_PATHS:
+            path = 'other'
+        metrics.inc('nixgui_requests_total', [('path', path)])
+        metrics.observe('nixgui_request_duration_seconds',
+                        time.perf_counter() - self.request_started, [('path', path)])
+        if path == '/search':
+            for phase, seconds in self.timings.items():
+                metrics.observe('nixgui_search_phase_seconds', seconds, [('phase', phase)])
+    
+    def annotate(self, package, installed_packages):
+        """A copy of a formatted package with installed status for one profile"""
+        if package is None:
+            return None
+        return {
+            **package,
+            'installed': bool(installed_packages) and self.is_installed(package['name'], installed_packages),
+            'hasInstalledData': bool(installed_packages)
+        }
+    
+    def annotate_response(self, response, installed_packages):
+        """Installed status for one profile on a (cached) /search response"""
+        if 'results' not in response:
+            return response
+        with self.timed('installed_check'):
+            return {
+                **response,
+                'results': [self.annotate(pkg, installed_packages) for pkg in response['results']],
+                'installedCheckAvailable': bool(installed_packages)
+            }
+    
+    @classmethod
+    def parse_fields(cls, value):
+        """Turn a fields= value into the tuple of result keys to return"""
+        if not value:
+            return cls.LIST_FIELDS
+        requested = {f.strip() for f in value.split(',')}
+        if 'all' in requested:
+            return cls.LIST_FIELDS + cls.DETAIL_FIELDS
+        return cls.LIST_FIELDS + tuple(f for f in cls.DETAIL_FIELDS if f in requested)
+    
+    def add_details(self, responses, fields):
+        """Fill requested detail fields into search results
+        
+        Search runs skip --meta (and the catalog only has names and
+        versions), so details come from resolve_attrs(): package_cache, or
+        one nix-env --meta -A run for every result that is missing.
+        """
+        if not any(f in self.DETAIL_FIELDS for f in fields):
+            return responses
+        attrs = list(dict.fromkeys(pkg['name'] for r in responses for pkg in r.get('results', [])))
+        if not attrs:
+            return responses
+        try:
+            packages = self.resolve_attrs(attrs)
+        except Exception as e:
+            print(f"  ⚠️  Could not load package details: {str(e)[:80]}")
+            return [{**r, 'detailsError': 'Could not load package details'} for r in responses]
+        return [
+            {**r, 'results': [
+                {**pkg, **{k: v for k, v in (packages.get(pkg['name']) or {}).items()
+                           if k in self.DETAIL_FIELDS}}
+                for pkg in r.get('results', [])
+            ]}
+            for r in responses
+        ]
+    
+    @staticmethod
+    def project(response, fields):
+        """Copy of a search response with each result cut down to fields"""
+        projected = dict(response)
+        projected['results'] = [
+            {key: pkg[key] for key in fields if key in pkg}
+            for pkg in response['results']
+        ]
+        return projected
+    
+    def begin_request(self):
+        self.request_started = time.perf_counter()
+        self.timings = {}
+        if self.accepted_at is not None:
+            self.timings['queue_wait'] = self.request_started - self.accepted_at
+            self.accepted_at = None
+    
+    def do_OPTIONS(self):
+        # CORS preflight for the JSON POST endpoint
+        self.begin_request()
+        self.send_response(204)
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
+        self.send_header('Access-Control-Allow-Headers', 'Content-Type')
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+    
+    def do_POST(self):
+        self.begin_request()
+        parsed_path = urlparse(self.path)
+        
+        # Always consume the body so the keep-alive connection stays in sync
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+            if length < 0:
+                raise ValueError
+        except ValueError:
+            # Without a usable length the body can't be skipped; drop the connection
+            self.close_connection = True
+            self.send_json({'error': 'Invalid Content-Length header'}, 400)
+            return
+        if length > self.MAX_BODY:
+            self.close_connection = True
+            self.send_json({'error': f'Request body larger than {self.MAX_BODY} bytes'}, 413)
+            return
+        body = self.rfile.read(length) if length else b''
+        
+        if parsed_path.path != '/search/batch':
+            self.send_json({
+                'error': 'Not found',
+                'availableEndpoints': ['POST /search/batch']
+            }, 404)
+            return
+        
+        try:
+            request = json.loads(body or b'{}')
+            queries = request.get('queries', [])
+            attrs = request.get('attrs', [])
+            profile = request.get('profile')
+            if not all(isinstance(v, list) and all(isinstance(x, str) for x in v)
+                       for v in (queries, attrs)) or not isinstance(profile, (str, type(None))):
+                raise ValueError
+        except (ValueError, AttributeError):
+            self.send_json({
+                'error': 'Expected a JSON object like {"queries": ["firefox"], "attrs": ["nixpkgs.vim"]}'
+            }, 400)
+            return
+        
+        try:
+            profile = self.resolve_profile(profile)
+        except ValueError as e:
+            self.send_json({'error': str(e)}, 400)
+            return
+        
+        if len(queries) + len(attrs) > self.MAX_BATCH:
+            self.send_json({'error': f'At most {self.MAX_BATCH} queries and attributes per batch'}, 400)
+            return
+        
+        normalized = [self.normalize_query(q) for q in queries]
+        try:
+            responses = self.search_batch([q for q in dict.fromkeys(normalized) if q])
+        except Exception as e:
+            self.send_json({'results': [], 'packages': {}, 'error': f'Server error: {str(e)}'})
+            return
+        
+        fields = request.get('fields')
+        if isinstance(fields, list):
+            fields = ','.join(str(f) for f in fields)
+        fields = self.parse_fields(fields if isinstance(fields, str) else None)
+        responses = dict(zip(responses, self.add_details(list(responses.values()), fields)))
+        installed_packages = self.installed_for(profile)
+        results = []
+        for original, query in zip(queries, normalized):
+            response = responses.get(query) or {'results': [], 'error': None, 'cached': False}
+            if query and not response.get('error'):
+                self.query_log.record(query)
+            response = self.annotate_response(response, installed_packages)
+            results.append({'query': original, **self.project(response, fields)})
+        
+        packages, error = {}, None
+        if attrs:
+            try:
+                packages = self.resolve_attrs(list(dict.fromkeys(attrs)))
+            except subprocess.TimeoutExpired:
+                error = 'Attribute lookup timed out.'
+            except Exception as e:
+                error = f'Attribute lookup failed: {str(e)}'
+        
+        self.send_json({
+            'results': results,
+            'packages': {attr: self.annotate(package, installed_packages)
+                         for attr, package in packages.items()},
+            'error': error
+        })
+    
+    def do_GET(self):
+        self.begin_request()
+        
+        # Parse URL
+        parsed_path = urlparse(self.path)
         
         if parsed_path.path == '/search':
             # Get query parameter
             query_params = parse_qs(parsed_path.query)
-            query = query_params.get('q', [''])[0]
+            query = self.normalize_query(query_params.get('q', [''])[0])
+            fields = self.parse_fields(query_params.get('fields', [''])[0])
+            try:
+                profile = self.resolve_profile(query_params.get('profile', [''])[0])
+            except ValueError as e:
+                self.send_json({'results': [], 'error': str(e), 'cached': False}, 400)
+                return
             
             if not query:
-                self.wfile.write(json.dumps({
+                self.send_json({
                     'results': [],
                     'error': None,
                     'cached': False
-                }).encode())
+                })
                 return
             
-            # Check cache first
-            cache_key = self.get_cache_key(query)
-            if cache_key in self.search_cache:
-                cache_entry = self.search_cache[cache_key]
-                if time.time() - cache_entry['timestamp'] < self.CACHE_TTL:
-                    print(f"💾 Cache HIT for '{query}'")
-                    response = cache_entry['data'].copy()
-                    response['cached'] = True
-                    self.wfile.write(json.dumps(response).encode())
-                    return
+            response = self.search(query)
+            if not response.get('error'):
+                self.query_log.record(query)
+            response = self.annotate_response(response, self.installed_for(profile))
+            response = self.add_details([response], fields)[0]
+            self.send_json(self.project(response, fields))
+        
+        elif parsed_path.path.startswith('/package/'):
+            # Full metadata for one attribute path, e.g. /package/nixpkgs.firefox
+            attr = unquote(parsed_path.path[len('/package/'):])
+            if not attr:
+                self.send_json({'package': None, 'error': 'No attribute given', 'cached': False})
+                return
+            try:
+                profile = self.resolve_profile(parse_qs(parsed_path.query).get('profile', [''])[0])
+            except ValueError as e:
+                self.send_json({'package': None, 'error': str(e), 'cached': False}, 400)
+                return
             
+            cache_entry = self.package_cache.get(attr)
+            cached = (bool(cache_entry) and
+                      time.time() - cache_entry['timestamp'] < cache_entry.get('ttl', self.CACHE_TTL))
             try:
-                # Run nix search with timeout
-                print(f"🔍 Searching for '{query}'...")
-                result = subprocess.run(
-                    ['nix-env', '-qa', f'.*{query}.*', '--json'],
-                    capture_output=True,
-                    text=True,
-                    timeout=30
-                )
-                
-                if result.returncode != 0:
-                    response = {
-                        'results': [],
-                        'error': f'Search failed: {result.stderr[:200]}',
-                        'cached': False
-                    }
-                    self.wfile.write(json.dumps(response).encode())
-                    return
-                
-                # Parse results
-                try:
-                    packages = json.loads(result.stdout)
-                except json.JSONDecodeError:
-                    response = {
-                        'results': [],
-                        'error': 'Invalid response from nix-env',
-                        'cached': False
-                    }
-                    self.wfile.write(json.dumps(response).encode())
-                    return
-                
-                # Get current installed packages
-                installed_packages = self.installed_cache['packages']
-                
-                # Format results with installed status
-                formatted_results = []
-                for name, info in list(packages.items())[:50]:
-                    # Check installed status if we have that data
-                    is_installed = False
-                    if installed_packages:
-                        base_name = name.split('-')[0]
-                        is_installed = (
-                            name in installed_packages or
-                            base_name in installed_packages or
-                            any(inst.startswith(base_name) for inst in installed_packages)
-                        )
-                    
-                    formatted_results.append({
-                        'name': name,
-                        'version': info.get('version', 'unknown'),
-                        'description': info.get('meta', {}).get('description', 'No description'),
-                        'installed': is_installed,
-                        'hasInstalledData': bool(installed_packages)
-                    })
-                
-                response = {
-                    'results': formatted_results,
-                    'error': None,
-                    'total': len(packages),
-                    'installedCheckAvailable': bool(installed_packages),
-                    'cached': False
-                }
-                
-                # Cache the response
-                self.search_cache[cache_key] = {
-                    'data': response,
-                    'timestamp': time.time()
-                }
-                print(f"💾 Cached results for '{query}'")
-                
-                # Clean old cache entries periodically
-                if len(self.search_cache) > 100:
-                    self.clean_cache()
-                
-                self.wfile.write(json.dumps(response).encode())
-                
+                package = self.resolve_attrs([attr])[attr]
             except subprocess.TimeoutExpired:
-                response = {
-                    'results': [],
-                    'error': 'Search timed out. Try a more specific query.',
-                    'cached': False
-                }
-                self.wfile.write(json.dumps(response).encode())
+                self.send_json({'package': None, 'error': 'Lookup timed out.', 'cached': False})
+                return
             except Exception as e:
-                response = {
-                    'results': [],
-                    'error': f'Server error: {str(e)}',
-                    'cached': False
-                }
-                self.wfile.write(json.dumps(response).encode())
+                self.send_json({'package': None, 'error': f'Server error: {str(e)}', 'cached': False})
+                return
+            
+            self.send_json({
+                'package': self.annotate(package, self.installed_for(profile)),
+                'error': None if package else f'Package {attr} not found',
+                'cached': cached
+            })
         
         elif parsed_path.path == '/health':
-            self.wfile.write(json.dumps({
+            # Answers from the first moment; 'ready' says whether the fast
+            # search path is up yet and 'warmup' how far along it is
+            installed_packages = self.installed_cache['packages']
+            catalog = self.catalog
+            self.send_json({
                 'status': 'ok',
                 'service': 'nixos-package-search-cached',
+                'ready': catalog is not None,
+                'warmup': self.warmup_progress(),
                 'features': {
                     'search': True,
-                    'installedStatus': bool(self.installed_cache['packages']),
-                    'installedCount': len(self.installed_cache['packages']),
+                    'installedStatus': bool(installed_packages),
+                    'installedCount': len(installed_packages),
                     'caching': True,
-                    'cacheSize': len(self.search_cache)
+                    'cacheSize': len(self.search_cache),
+                    'catalog': catalog is not None,
+                    'catalogPackages': catalog.count if catalog else 0,
+                    'evaluator': self.evaluator.status() if self.evaluator else None,
+                    'workers': self.workers
                 },
                 'port': 5001
-            }).encode())
+            })
         
         elif parsed_path.path == '/cache/stats':
             # Cache statistics endpoint
@@ -275,35 +1822,78 @@ class CachedPackageSearchHandler(BaseHTTPRequestHandler):
             avg_age = 0
             if self.search_cache:
                 avg_age = sum(time.time() - entry['timestamp'] 
-                             for entry in self.search_cache.values()) / len(self.search_cache)
+                             for entry in list(self.search_cache.values())) / len(self.search_cache)
             
-            self.wfile.write(json.dumps({
+            totals = self.all_metrics()
+            self.send_json({
                 'searchCache': {
                     'entries': len(self.search_cache),
                     'avgAge': f"{avg_age:.0f} seconds" if avg_age else "N/A",
+                    'ttl': self.CACHE_TTL,
+                    'hits': totals.get('nixgui_cache_hits_total'),
+                    'misses': totals.get('nixgui_cache_misses_total')
+                },
+                'packageCache': {
+                    'entries': len(self.package_cache),
+                    'hits': totals.get('nixgui_package_cache_hits_total'),
+                    'misses': totals.get('nixgui_package_cache_misses_total'),
                     'ttl': self.CACHE_TTL
                 },
+                'negativeCache': {
+                    'entries': len(self.negative_cache),
+                    'hits': totals.get('nixgui_negative_cache_hits_total'),
+                    'ttl': self.NEGATIVE_TTL,
+                    'timeoutTtl': self.TIMEOUT_TTL
+                },
                 'installedCache': {
                     'packages': len(self.installed_cache['packages']),
                     'age': f"{time.time() - self.installed_cache['timestamp']:.0f} seconds",
                     'ttl': self.INSTALLED_TTL
+                },
+                'profileCache': {
+                    profile: {
+                        'packages': len(snapshot['packages']),
+                        'age': f"{time.time() - snapshot['timestamp']:.0f} seconds"
+                    }
+                    for profile, snapshot in list(self.profile_cache.items())
+                },
+                'queryLog': {
+                    'entries': len(self.query_log),
+                    'prewarmCount': self.PREWARM_COUNT,
+                    'prewarmed': totals.get('nixgui_prewarmed_queries_total')
                 }
-            }).encode())
+            })
         
         elif parsed_path.path == '/cache/clear':
             # Clear cache endpoint
             old_size = len(self.search_cache)
             self.search_cache.clear()
-            self.installed_cache = {'packages': set(), 'timestamp': 0}
+            self.negative_cache.clear()
+            self.package_cache.clear()
+            self.profile_cache.clear()
+            metrics.inc('nixgui_cache_evictions_total', [('reason', 'cleared')], old_size)
+            # Force a refresh of installed packages on the next connection
+            self.installed_cache['timestamp'] = 0
+            # Refill the cache with the usual queries in the background
+            self.prewarm_requested.set()
             
-            self.wfile.write(json.dumps({
+            self.send_json({
                 'cleared': True,
                 'entriesRemoved': old_size
-            }).encode())
+            })
+        
+        elif parsed_path.path == '/metrics':
+            # Prometheus scrape endpoint
+            body = self.all_metrics().render({
+                'nixgui_search_cache_entries': len(self.search_cache),
+                'nixgui_negative_cache_entries': len(self.negative_cache),
+                'nixgui_installed_packages': len(self.installed_cache['packages'])
+            }).encode()
+            self.send_body(body, 'text/plain; version=0.0.4; charset=utf-8')
         
         elif parsed_path.path == '/debug':
             # Debug endpoint to check what's happening
-            self.wfile.write(json.dumps({
+            self.send_json({
                 'installedPackages': list(self.installed_cache['packages'])[:20],
                 'totalInstalled': len(self.installed_cache['packages']),
                 'cacheEntries': len(self.search_cache),
@@ -313,28 +1903,121 @@ class CachedPackageSearchHandler(BaseHTTPRequestHandler):
                     'HOME': os.environ.get('HOME'),
                     'NIX_PATH': os.environ.get('NIX_PATH', 'not set')
                 }
-            }).encode())
+            })
         
         else:
-            self.wfile.write(json.dumps({
+            self.send_json({
                 'error': 'Not found',
                 'availableEndpoints': [
-                    '/search?q=query',
+                    '/search?q=query&fields=description,homepage&profile=system',
+                    'POST /search/batch',
+                    '/package/<attr>',
                     '/health',
                     '/cache/stats',
                     '/cache/clear',
+                    '/metrics',
                     '/debug'
                 ]
-            }).encode())
+            })
     
     def log_message(self, format, *args):
         # Only log errors
-        if args[1] != '200':
+        if len(args) < 2 or args[1] != '200':
             print(format % args)
 
+class SearchServer(ThreadingHTTPServer):
+    """Threading server that remembers when each connection was accepted"""
+    
+    def __init__(self, *args, **kwargs):
+        self.accepted_at = {}  # socket -> perf_counter() at accept
+        super().__init__(*args, **kwargs)
+    
+    def get_request(self):
+        request, client_address = super().get_request()
+        self.accepted_at[request] = time.perf_counter()
+        return request, client_address
+    
+    def shutdown_request(self, request):
+        self.accepted_at.pop(request, None)  # refused or failed before a handler ran
+        super().shutdown_request(request)
+
+def run_workers(server, workers):
+    """Pre-fork workers that all accept() on the server's listening socket"""
+    children = {}
+    
+    def spawn(index):
+        pid = os.fork()
+        if pid == 0:
+            # Stop like on Ctrl+C, so the query log gets saved
+            signal.signal(signal.SIGTERM, stop)
+            threading.Thread(target=flush_metrics_forever, daemon=True).start()
+            CachedPackageSearchHandler.start_warmup()
+            try:
+                server.serve_forever()
+            except KeyboardInterrupt:
+                pass
+            CachedPackageSearchHandler.query_log.flush()
+            if PackageSearch.evaluator:
+                PackageSearch.evaluator.stop()
+            os._exit(0)
+        children[pid] = index
+        print(f"   Worker {index} started (PID {pid})")
+    
+    def stop(signum, frame):
+        raise KeyboardInterrupt
+    
+    signal.signal(signal.SIGTERM, stop)
+    for index in range(workers):
+        spawn(index)
+    try:
+        while True:
+            pid, status = os.wait()
+            index = children.pop(pid, None)
+            if index is not None:
+                print(f"⚠️  Worker {index} (PID {pid}) exited with status {status}, restarting")
+                time.sleep(1)
+                spawn(index)
+    except KeyboardInterrupt:
+        print("\n👋 Shutting down workers...")
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        for pid in list(children):
+            try:
+                os.waitpid(pid, 0)
+            except ChildProcessError:
+                pass
+        server.server_close()
+
+def flush_metrics_forever():
+    while True:
+        time.sleep(CachedPackageSearchHandler.METRICS_FLUSH_INTERVAL)
+        try:
+            CachedPackageSearchHandler.flush_metrics()
+        except sqlite3.Error as e:
+            print(f"⚠️  Could not publish metrics: {e}")
+
 if __name__ == '__main__':
     PORT = 5001  # Using our designated port!
     
+    parser = argparse.ArgumentParser(description='Cached NixOS package search backend')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='worker processes sharing one cache (default: 1, in-memory cache)')
+    parser.add_argument('--cache-db', default=os.path.join(CACHE_DIR, 'cache.sqlite'),
+                        help='shared cache file used when --workers > 1')
+    parser.add_argument('--catalog', default=CachedPackageSearchHandler.CATALOG_PATH,
+                        help='where to keep the package catalog used for fast searches')
+    parser.add_argument('--evaluator', action='store_true',
+                        help='keep a warm nix repl per worker for cache misses (uses a lot of memory)')
+    parser.add_argument('--evaluator-max-rss', type=int, default=4096,
+                        help='restart the nix repl above this many MB (default: 4096)')
+    args = parser.parse_args()
+    CachedPackageSearchHandler.CATALOG_PATH = args.catalog
+    if args.evaluator:
+        PackageSearch.evaluator = Evaluator(max_rss_mb=args.evaluator_max_rss)
+    
     print("🚀 Cached NixOS Package Search Backend")
     print(f"📍 Running on http://localhost:{PORT}")
     print("✨ Features:")
@@ -344,11 +2027,27 @@ if __name__ == '__main__':
     print("   - Works with different Nix versions")
     print(f"🔍 Try http://localhost:{PORT}/search?q=firefox")
     print(f"📊 Cache stats at http://localhost:{PORT}/cache/stats")
+    print(f"📈 Prometheus metrics at http://localhost:{PORT}/metrics")
     print()
     
-    server = HTTPServer(('localhost', PORT), CachedPackageSearchHandler)
+    server = SearchServer(('localhost', PORT), CachedPackageSearchHandler)
+    
+    if args.workers > 1:
+        print(f"🧵 Pre-forking {args.workers} workers, shared cache at {args.cache_db}")
+        SharedCache.initialize(args.cache_db)
+        CachedPackageSearchHandler.use_shared_store(args.cache_db, args.workers)
+        # Metrics and warm-up state from a previous run would confuse this one
+        CachedPackageSearchHandler.metrics_store.clear()
+        CachedPackageSearchHandler.warmup_store.clear()
+        run_workers(server, args.workers)
+        sys.exit(0)
+    
+    CachedPackageSearchHandler.start_warmup()
     try:
         server.serve_forever()
     except KeyboardInterrupt:
         print("\n👋 Shutting down gracefully...")
+        CachedPackageSearchHandler.query_log.flush()
+        if PackageSearch.evaluator:
+            PackageSearch.evaluator.stop()
         server.shutdown()
\ No newline at end of file
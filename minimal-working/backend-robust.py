@@ -4,21 +4,51 @@ Robust NixOS Package Search Backend
 Handles permission issues and different Nix versions gracefully
 """
 
-from http.server import HTTPServer, BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
 from urllib.parse import urlparse, parse_qs
 import subprocess
 import json
 import re
 import os
 import sys
+import time
+import threading
 
 class PackageSearchHandler(BaseHTTPRequestHandler):
+    # Reuse connections across searches (HTTP/1.1 keep-alive)
+    protocol_version = 'HTTP/1.1'
+    timeout = 15
+    disable_nagle_algorithm = True
+    
+    # Installed packages are probed in a background thread, so the server
+    # answers from the moment it binds; results show no installed status
+    # until the first probe is done
+    installed_packages = set()
+    installed_checked = 0  # time of the last finished probe, 0 = never
+    INSTALLED_TTL = 300  # re-probe after 5 minutes
+    installed_lock = threading.Lock()
+    
     def __init__(self, *args, **kwargs):
-        # Cache installed packages on startup
-        print("🔍 Checking installed packages...")
-        self.installed_packages = self.get_installed_packages()
+        if time.time() - self.installed_checked > self.INSTALLED_TTL:
+            self.refresh_installed_async()
         super().__init__(*args, **kwargs)
     
+    @classmethod
+    def refresh_installed_async(cls):
+        if not cls.installed_lock.locked():
+            threading.Thread(target=cls.refresh_installed, daemon=True).start()
+    
+    @classmethod
+    def refresh_installed(cls):
+        if not cls.installed_lock.acquire(blocking=False):
+            return  # another thread is already probing
+        try:
+            print("🔍 Checking installed packages...")
+            cls.installed_packages = cls.get_installed_packages()
+            cls.installed_checked = time.time()
+        finally:
+            cls.installed_lock.release()
+    
     @staticmethod
     def get_installed_packages():
         """Get list of installed package names - handles multiple scenarios"""
@@ -99,15 +129,21 @@ class PackageSearchHandler(BaseHTTPRequestHandler):
         print("  ⚠️  Could not determine installed packages - feature disabled")
         return set()
     
-    def do_GET(self):
-        # Parse URL
-        parsed_path = urlparse(self.path)
-        
-        # Enable CORS
-        self.send_response(200)
+    def send_json(self, data, status=200):
+        """Send a JSON response with Content-Length so keep-alive framing works"""
+        body = json.dumps(data).encode()
+        self.send_response(status)
         self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
         self.send_header('Access-Control-Allow-Origin', '*')
+        if not self.close_connection:
+            self.send_header('Keep-Alive', f'timeout={self.timeout}')
         self.end_headers()
+        self.wfile.write(body)
+    
+    def do_GET(self):
+        # Parse URL
+        parsed_path = urlparse(self.path)
         
         if parsed_path.path == '/search':
             # Get query parameter
@@ -115,10 +151,10 @@ class PackageSearchHandler(BaseHTTPRequestHandler):
             query = query_params.get('q', [''])[0]
             
             if not query:
-                self.wfile.write(json.dumps({
+                self.send_json({
                     'results': [],
                     'error': None
-                }).encode())
+                })
                 return
             
             try:
@@ -132,20 +168,20 @@ class PackageSearchHandler(BaseHTTPRequestHandler):
                 )
                 
                 if result.returncode != 0:
-                    self.wfile.write(json.dumps({
+                    self.send_json({
                         'results': [],
                         'error': f'Search failed: {result.stderr[:200]}'
-                    }).encode())
+                    })
                     return
                 
                 # Parse results
                 try:
                     packages = json.loads(result.stdout)
                 except json.JSONDecodeError:
-                    self.wfile.write(json.dumps({
+                    self.send_json({
                         'results': [],
                         'error': 'Invalid response from nix-env'
-                    }).encode())
+                    })
                     return
                 
                 # Format results with installed status
@@ -169,39 +205,40 @@ class PackageSearchHandler(BaseHTTPRequestHandler):
                         'hasInstalledData': bool(self.installed_packages)
                     })
                 
-                self.wfile.write(json.dumps({
+                self.send_json({
                     'results': formatted_results,
                     'error': None,
                     'total': len(packages),
                     'installedCheckAvailable': bool(self.installed_packages)
-                }).encode())
+                })
                 
             except subprocess.TimeoutExpired:
-                self.wfile.write(json.dumps({
+                self.send_json({
                     'results': [],
                     'error': 'Search timed out. Try a more specific query.'
-                }).encode())
+                })
             except Exception as e:
-                self.wfile.write(json.dumps({
+                self.send_json({
                     'results': [],
                     'error': f'Server error: {str(e)}'
-                }).encode())
+                })
         
         elif parsed_path.path == '/health':
-            self.wfile.write(json.dumps({
+            self.send_json({
                 'status': 'ok',
                 'service': 'nixos-package-search-robust',
+                'ready': bool(self.installed_checked),
                 'features': {
                     'search': True,
                     'installedStatus': bool(self.installed_packages),
                     'installedCount': len(self.installed_packages)
                 },
                 'port': 5001
-            }).encode())
+            })
         
         elif parsed_path.path == '/debug':
             # Debug endpoint to check what's happening
-            self.wfile.write(json.dumps({
+            self.send_json({
                 'installedPackages': list(self.installed_packages)[:20],
                 'totalInstalled': len(self.installed_packages),
                 'pythonVersion': sys.version,
@@ -210,17 +247,17 @@ class PackageSearchHandler(BaseHTTPRequestHandler):
                     'HOME': os.environ.get('HOME'),
                     'NIX_PATH': os.environ.get('NIX_PATH', 'not set')
                 }
-            }).encode())
+            })
         
         else:
-            self.wfile.write(json.dumps({
+            self.send_json({
                 'error': 'Not found',
                 'availableEndpoints': ['/search?q=query', '/health', '/debug']
-            }).encode())
+            })
     
     def log_message(self, format, *args):
         # Only log errors
-        if args[1] != '200':
+        if len(args) < 2 or args[1] != '200':
             print(format % args)
 
 if __name__ == '__main__':
@@ -236,7 +273,8 @@ if __name__ == '__main__':
     print(f"🐛 Debug info at http://localhost:{PORT}/debug")
     print()
     
-    server = HTTPServer(('localhost', PORT), PackageSearchHandler)
+    server = ThreadingHTTPServer(('localhost', PORT), PackageSearchHandler)
+    PackageSearchHandler.refresh_installed_async()
     try:
         server.serve_forever()
     except KeyboardInterrupt:
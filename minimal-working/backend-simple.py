@@ -4,21 +4,32 @@ Ultra-minimal NixOS Package Search Backend
 Uses only Python standard library - no Flask needed!
 """
 
-from http.server import HTTPServer, BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
 from urllib.parse import urlparse, parse_qs
 import subprocess
 import json
 
 class PackageSearchHandler(BaseHTTPRequestHandler):
-    def do_GET(self):
-        # Parse URL
-        parsed_path = urlparse(self.path)
-        
-        # Enable CORS
-        self.send_response(200)
+    # HTTP/1.1 keep-alive, configured as in backend-cached.py
+    protocol_version = 'HTTP/1.1'
+    timeout = 15
+    disable_nagle_algorithm = True
+    
+    def send_json(self, data, status=200):
+        """Send a JSON response with Content-Length so keep-alive framing works"""
+        body = json.dumps(data).encode()
+        self.send_response(status)
         self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
         self.send_header('Access-Control-Allow-Origin', '*')
+        if not self.close_connection:
+            self.send_header('Keep-Alive', f'timeout={self.timeout}')
         self.end_headers()
+        self.wfile.write(body)
+    
+    def do_GET(self):
+        # Parse URL
+        parsed_path = urlparse(self.path)
         
         if parsed_path.path == '/search':
             # Get query parameter
@@ -26,10 +37,10 @@ class PackageSearchHandler(BaseHTTPRequestHandler):
             query = query_params.get('q', [''])[0]
             
             if not query:
-                self.wfile.write(json.dumps({
+                self.send_json({
                     'results': [],
                     'error': None
-                }).encode())
+                })
                 return
             
             try:
@@ -42,10 +53,10 @@ class PackageSearchHandler(BaseHTTPRequestHandler):
                 )
                 
                 if result.returncode != 0:
-                    self.wfile.write(json.dumps({
+                    self.send_json({
                         'results': [],
                         'error': f'nix command failed: {result.stderr}'
-                    }).encode())
+                    })
                     return
                 
                 # Parse results
@@ -60,28 +71,28 @@ class PackageSearchHandler(BaseHTTPRequestHandler):
                         'description': info.get('meta', {}).get('description', 'No description')
                     })
                 
-                self.wfile.write(json.dumps({
+                self.send_json({
                     'results': formatted_results,
                     'error': None,
                     'total': len(packages)
-                }).encode())
+                })
                 
             except Exception as e:
-                self.wfile.write(json.dumps({
+                self.send_json({
                     'results': [],
                     'error': str(e)
-                }).encode())
+                })
         
         elif parsed_path.path == '/health':
-            self.wfile.write(json.dumps({
+            self.send_json({
                 'status': 'ok',
                 'service': 'nixos-package-search-simple'
-            }).encode())
+            })
         
         else:
-            self.wfile.write(json.dumps({
+            self.send_json({
                 'error': 'Not found'
-            }).encode())
+            })
     
     def log_message(self, format, *args):
         # Suppress default logging
@@ -92,5 +103,5 @@ if __name__ == '__main__':
     print("📍 Running on http://localhost:5000")
     print("🔍 Try http://localhost:5000/search?q=firefox")
     
-    server = HTTPServer(('localhost', 5000), PackageSearchHandler)
+    server = ThreadingHTTPServer(('localhost', 5000), PackageSearchHandler)
     server.serve_forever()
\ No newline at end of file
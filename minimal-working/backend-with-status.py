@@ -4,18 +4,48 @@ NixOS Package Search Backend - With Installed Status
 Now checks if packages are installed using 'nix profile list'
 """
 
-from http.server import HTTPServer, BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
 from urllib.parse import urlparse, parse_qs
 import subprocess
 import json
 import re
+import time
+import threading
 
 class PackageSearchHandler(BaseHTTPRequestHandler):
+    # Keep connections open between searches and status polls
+    protocol_version = 'HTTP/1.1'
+    timeout = 15
+    disable_nagle_algorithm = True
+    
+    # Installed packages are probed in a background thread, so the server
+    # answers from the moment it binds; results show no installed status
+    # until the first probe is done
+    installed_packages = set()
+    installed_checked = 0  # time of the last finished probe, 0 = never
+    INSTALLED_TTL = 300  # re-probe after 5 minutes
+    installed_lock = threading.Lock()
+    
     def __init__(self, *args, **kwargs):
-        # Cache installed packages on startup
-        self.installed_packages = self.get_installed_packages()
+        if time.time() - self.installed_checked > self.INSTALLED_TTL:
+            self.refresh_installed_async()
         super().__init__(*args, **kwargs)
     
+    @classmethod
+    def refresh_installed_async(cls):
+        if not cls.installed_lock.locked():
+            threading.Thread(target=cls.refresh_installed, daemon=True).start()
+    
+    @classmethod
+    def refresh_installed(cls):
+        if not cls.installed_lock.acquire(blocking=False):
+            return  # another thread is already probing
+        try:
+            cls.installed_packages = cls.get_installed_packages()
+            cls.installed_checked = time.time()
+        finally:
+            cls.installed_lock.release()
+    
     @staticmethod
     def get_installed_packages():
         """Get list of installed package names"""
@@ -57,15 +87,21 @@ class PackageSearchHandler(BaseHTTPRequestHandler):
         
         return set()
     
-    def do_GET(self):
-        # Parse URL
-        parsed_path = urlparse(self.path)
-        
-        # Enable CORS
-        self.send_response(200)
+    def send_json(self, data, status=200):
+        """Send a JSON response with Content-Length so keep-alive framing works"""
+        body = json.dumps(data).encode()
+        self.send_response(status)
         self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
         self.send_header('Access-Control-Allow-Origin', '*')
+        if not self.close_connection:
+            self.send_header('Keep-Alive', f'timeout={self.timeout}')
         self.end_headers()
+        self.wfile.write(body)
+    
+    def do_GET(self):
+        # Parse URL
+        parsed_path = urlparse(self.path)
         
         if parsed_path.path == '/search':
             # Get query parameter
@@ -73,10 +109,10 @@ class PackageSearchHandler(BaseHTTPRequestHandler):
             query = query_params.get('q', [''])[0]
             
             if not query:
-                self.wfile.write(json.dumps({
+                self.send_json({
                     'results': [],
                     'error': None
-                }).encode())
+                })
                 return
             
             try:
@@ -89,17 +125,17 @@ class PackageSearchHandler(BaseHTTPRequestHandler):
                 )
                 
                 if result.returncode != 0:
-                    self.wfile.write(json.dumps({
+                    self.send_json({
                         'results': [],
                         'error': f'nix command failed: {result.stderr}'
-                    }).encode())
+                    })
                     return
                 
                 # Parse results
                 packages = json.loads(result.stdout)
                 
                 # Refresh installed packages cache
-                self.installed_packages = self.get_installed_packages()
+                self.refresh_installed()
                 
                 # Format results with installed status
                 formatted_results = []
@@ -120,40 +156,41 @@ class PackageSearchHandler(BaseHTTPRequestHandler):
                         'installed': is_installed
                     })
                 
-                self.wfile.write(json.dumps({
+                self.send_json({
                     'results': formatted_results,
                     'error': None,
                     'total': len(packages)
-                }).encode())
+                })
                 
             except Exception as e:
-                self.wfile.write(json.dumps({
+                self.send_json({
                     'results': [],
                     'error': str(e)
-                }).encode())
+                })
         
         elif parsed_path.path == '/health':
-            self.wfile.write(json.dumps({
+            self.send_json({
                 'status': 'ok',
                 'service': 'nixos-package-search-with-status',
+                'ready': bool(self.installed_checked),
                 'features': ['search', 'installed-status']
-            }).encode())
+            })
         
         elif parsed_path.path == '/installed':
             # Endpoint to get just installed packages
-            self.wfile.write(json.dumps({
+            self.send_json({
                 'installed': list(self.installed_packages),
                 'count': len(self.installed_packages)
-            }).encode())
+            })
         
         else:
-            self.wfile.write(json.dumps({
+            self.send_json({
                 'error': 'Not found'
-            }).encode())
+            })
     
     def log_message(self, format, *args):
         # Only log errors
-        if args[1] != '200':
+        if len(args) < 2 or args[1] != '200':
             print(format % args)
 
 if __name__ == '__main__':
@@ -162,5 +199,6 @@ if __name__ == '__main__':
     print("✨ NEW: Shows which packages are installed")
     print("🔍 Try http://localhost:5000/search?q=firefox")
     
-    server = HTTPServer(('localhost', 5000), PackageSearchHandler)
+    server = ThreadingHTTPServer(('localhost', 5000), PackageSearchHandler)
+    PackageSearchHandler.refresh_installed_async()
     server.serve_forever()
\ No newline at end of file
@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+"""
+Reproducible backend benchmark
+Runs the backend-*.py variants against the fake nix-env stub and reports
+throughput and latency percentiles for a set of scenarios
+
+Usage:
+  python3 bench/benchmark.py --backend backend-cached.py --backend backend-robust.py
+  python3 bench/benchmark.py --backend backend-cached.py --delay 0.5 --json results.json
+"""
+
+import argparse
+import http.client
+import json
+import math
+import os
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from urllib.parse import quote
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(HERE)
+FAKE_NIX_DIR = os.path.join(HERE, 'fake-nix')
+DEFAULT_CATALOG = os.path.join(HERE, 'fixtures', 'catalog.json')
+
+# Queries that hit the fixture; the first few are also used for typing runs
+QUERIES = ['firefox', 'python', 'vim', 'git', 'nodejs', 'rust', 'docker', 'postgres',
+           'htop', 'emacs', 'ffmpeg', 'signal', 'kitty', 'terraform', 'redis', 'numpy',
+           'flask', 'chromium', 'gimp', 'jq', 'ripgrep', 'tmux', 'zsh', 'curl']
+TYPED_WORDS = ['firefox', 'python3', 'neovim', 'libreoffice', 'kubectl']
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of a list of numbers"""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = max(1, math.ceil(pct / 100.0 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def summarize(name, latencies, errors, elapsed):
+    """Turn raw latencies (seconds) into a report row"""
+    count = len(latencies) + errors
+    return {
+        'scenario': name,
+        'requests': count,
+        'errors': errors,
+        'throughput': count / elapsed if elapsed > 0 else 0.0,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p90_ms': percentile(latencies, 90) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+        'max_ms': max(latencies) * 1000 if latencies else 0.0,
+    }
+
+
+def print_report(backend, rows):
+    print(f"\n📊 {backend}")
+    print(f"   {'scenario':<12} {'reqs':>6} {'errs':>5} {'req/s':>9} "
+          f"{'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for row in rows:
+        print(f"   {row['scenario']:<12} {row['requests']:>6} {row['errors']:>5} "
+              f"{row['throughput']:>9.1f} {row['p50_ms']:>9.1f} {row['p90_ms']:>9.1f} "
+              f"{row['p99_ms']:>9.1f} {row['max_ms']:>9.1f}")
+
+
+class Client:
+    """One keep-alive HTTP connection, reconnecting when the server closes it"""
+
+    def __init__(self, port, timeout=60, host='localhost'):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.conn = None
+
+    def get(self, path):
+        """Return (seconds, status, decoded JSON or None)"""
+        for attempt in range(2):
+            if self.conn is None:
+                self.conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            start = time.perf_counter()
+            try:
+                self.conn.request('GET', path)
+                response = self.conn.getresponse()
+                body = response.read()
+                elapsed = time.perf_counter() - start
+                if response.getheader('Connection', '').lower() == 'close' or response.version == 10:
+                    self.close()
+                try:
+                    data = json.loads(body)
+                except ValueError:
+                    data = None
+                return elapsed, response.status, data
+            except (http.client.HTTPException, ConnectionError, socket.timeout):
+                # Stale keep-alive connection; retry once on a fresh one
+                self.close()
+                if attempt:
+                    raise
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+
+def search_ok(status, data):
+    return status == 200 and isinstance(data, dict) and isinstance(data.get('results'), list) \
+        and not data.get('error')
+
+
+def run_searches(client, queries):
+    latencies, errors = [], 0
+    for query in queries:
+        try:
+            elapsed, status, data = client.get(f'/search?q={quote(query)}')
+        except (OSError, http.client.HTTPException):
+            errors += 1
+            continue
+        if search_ok(status, data):
+            latencies.append(elapsed)
+        else:
+            errors += 1
+    return latencies, errors
+
+
+def scenario_cold(port, args):
+    """Distinct queries, each a cache miss"""
+    client = Client(port)
+    client.get('/cache/clear')
+    queries = QUERIES[:args.requests]
+    start = time.perf_counter()
+    latencies, errors = run_searches(client, queries)
+    elapsed = time.perf_counter() - start
+    client.close()
+    return summarize('cold', latencies, errors, elapsed)
+
+
+def scenario_warm(port, args):
+    """The same small set of queries repeated, so cached backends hit"""
+    client = Client(port)
+    warm_set = QUERIES[:5]
+    run_searches(client, warm_set)
+    queries = [warm_set[i % len(warm_set)] for i in range(args.requests)]
+    start = time.perf_counter()
+    latencies, errors = run_searches(client, queries)
+    elapsed = time.perf_counter() - start
+    client.close()
+    return summarize('warm', latencies, errors, elapsed)
+
+
+def scenario_typing(port, args):
+    """Every prefix of a word, as an undebounced search-as-you-type client sends"""
+    client = Client(port)
+    client.get('/cache/clear')
+    queries = [word[:i] for word in TYPED_WORDS for i in range(2, len(word) + 1)]
+    start = time.perf_counter()
+    latencies, errors = run_searches(client, queries)
+    elapsed = time.perf_counter() - start
+    client.close()
+    return summarize('typing', latencies, errors, elapsed)
+
+
+def scenario_concurrent(port, args):
+    """Several clients searching a shared pool of queries at once"""
+    results = []
+    lock = threading.Lock()
+
+    def worker(offset):
+        client = Client(port)
+        queries = [QUERIES[(offset + i) % 10] for i in range(args.requests)]
+        latencies, errors = run_searches(client, queries)
+        client.close()
+        with lock:
+            results.append((latencies, errors))
+
+    Client(port).get('/cache/clear')
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(args.clients)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    latencies = [l for lat, _ in results for l in lat]
+    errors = sum(e for _, e in results)
+    return summarize(f'concurrent{args.clients}', latencies, errors, elapsed)
+
+
+SCENARIOS = {
+    'cold': scenario_cold,
+    'warm': scenario_warm,
+    'typing': scenario_typing,
+    'concurrent': scenario_concurrent,
+}
+
+
+def backend_port(path):
+    """Backends hard-code their port; read it from the source"""
+    source = open(path).read()
+    match = re.search(r'PORT\s*=\s*(\d+)', source) or re.search(r"\('localhost',\s*(\d+)\)", source)
+    if not match:
+        raise SystemExit(f"❌ Could not find a port in {path}; pass --port")
+    return int(match.group(1))
+
+
+def port_in_use(port):
+    with socket.socket() as s:
+        return s.connect_ex(('localhost', port)) == 0
+
+
+def start_backend(path, port, args, cache_dir):
+    # A private cache dir keeps catalogs and query logs built from the fixture
+    # out of ~/.cache, where a real backend would pick them up
+    env = {
+        **os.environ,
+        'XDG_CACHE_HOME': cache_dir,
+        'PATH': FAKE_NIX_DIR + os.pathsep + os.environ.get('PATH', ''),
+        'FAKE_NIX_CATALOG': args.catalog,
+        'FAKE_NIX_DELAY': str(args.delay),
+        # /cache/clear must leave the next scenario cold, not prewarmed
+        'NIXGUI_PREWARM': '0',
+        'PYTHONUNBUFFERED': '1',
+    }
+    proc = subprocess.Popen([sys.executable, path] + args.backend_args, cwd=BACKEND_DIR, env=env,
+                            stdout=subprocess.DEVNULL if not args.verbose else None,
+                            stderr=subprocess.STDOUT if not args.verbose else None)
+    deadline = time.time() + args.startup_timeout
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise SystemExit(f"❌ {path} exited with code {proc.returncode}")
+        try:
+            client = Client(port, timeout=5)
+            client.get('/health')
+            client.close()
+            return proc
+        except OSError:
+            time.sleep(0.1)
+    proc.terminate()
+    raise SystemExit(f"❌ {path} did not answer /health within {args.startup_timeout}s")
+
+
+def stop_backend(proc):
+    proc.terminate()
+    try:
+        proc.wait(timeout=5)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the NixOS GUI search backends')
+    parser.add_argument('--backend', action='append', required=True,
+                        help='backend script, relative to minimal-working/ (repeatable)')
+    parser.add_argument('--backend-arg', dest='backend_args', action='append', default=[],
+                        help='extra argument passed to every backend, e.g. --backend-arg=--workers=4')
+    parser.add_argument('--port', type=int, help='override the port read from the backend source')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS),
+                        help=f"comma-separated subset of: {', '.join(SCENARIOS)}")
+    parser.add_argument('--requests', type=int, default=20, help='requests per client per scenario')
+    parser.add_argument('--clients', type=int, default=8, help='clients in the concurrent scenario')
+    parser.add_argument('--delay', type=float, default=0.2,
+                        help='simulated nix evaluation time per nix-env call, seconds')
+    parser.add_argument('--catalog', default=DEFAULT_CATALOG, help='catalog fixture to serve')
+    parser.add_argument('--startup-timeout', type=float, default=30)
+    parser.add_argument('--json', help='also write results to this file')
+    parser.add_argument('--verbose', action='store_true', help='show backend output')
+    args = parser.parse_args()
+
+    scenarios = [s.strip() for s in args.scenarios.split(',') if s.strip()]
+    for name in scenarios:
+        if name not in SCENARIOS:
+            parser.error(f"unknown scenario '{name}'")
+
+    report = {}
+    for backend in args.backend:
+        path = os.path.join(BACKEND_DIR, backend)
+        port = args.port or backend_port(path)
+        if port_in_use(port):
+            raise SystemExit(f"❌ Port {port} is already in use; stop whatever is running there first")
+
+        print(f"🚀 Starting {backend} on port {port} (nix delay {args.delay}s)...")
+        with tempfile.TemporaryDirectory(prefix='nixgui-bench-') as cache_dir:
+            proc = start_backend(path, port, args, cache_dir)
+            try:
+                rows = [SCENARIOS[name](port, args) for name in scenarios]
+            finally:
+                stop_backend(proc)
+        report[backend] = rows
+        print_report(backend, rows)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'delay': args.delay, 'results': report}, f, indent=2)
+        print(f"\n💾 Results written to {args.json}")
+
+
+if __name__ == '__main__':
+    main()
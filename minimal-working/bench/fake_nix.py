@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+Fake nix-env / nix commands for benchmarking
+Serves a recorded catalog fixture instead of evaluating nixpkgs
+
+Environment:
+  FAKE_NIX_CATALOG    path to a `nix-env -qa --json` style catalog
+  FAKE_NIX_DELAY      seconds to sleep before answering a query (default 0)
+  FAKE_NIX_INSTALLED  comma-separated attribute names reported as installed
+  FAKE_NIX_PROFILES   JSON object of profile path -> comma-separated attribute
+                      names, for --profile; unknown profiles are empty
+
+`nix repl` understands only the expressions backend-cached.py's Evaluator
+sends; forcing nixguiIndex takes FAKE_NIX_DELAY, searches are immediate.
+"""
+
+import json
+import os
+import re
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_CATALOG = os.path.join(HERE, 'fixtures', 'catalog.json')
+DEFAULT_INSTALLED = 'firefox,git,vim,htop,ripgrep'
+
+
+def load_catalog():
+    with open(os.environ.get('FAKE_NIX_CATALOG', DEFAULT_CATALOG)) as f:
+        return json.load(f)
+
+
+def package_name(name):
+    """Name part of a derivation name; nix-env matches selectors against it"""
+    match = re.search(r'-(?=[^A-Za-z])', name)
+    return name[:match.start()] if match else name
+
+
+def installed_entries(catalog, profile=None):
+    """Catalog entries installed in a profile (the user's by default)"""
+    if profile:
+        wanted = json.loads(os.environ.get('FAKE_NIX_PROFILES', '{}')).get(profile, '').split(',')
+    else:
+        wanted = os.environ.get('FAKE_NIX_INSTALLED', DEFAULT_INSTALLED).split(',')
+    entries = []
+    for attr in filter(None, (w.strip() for w in wanted)):
+        info = catalog.get(f'nixpkgs.{attr}')
+        if info:
+            entries.append((attr, info))
+    return entries
+
+
+def profile_arg(args):
+    """Value of --profile PATH, or None"""
+    if '--profile' in args and args.index('--profile') + 1 < len(args):
+        return args[args.index('--profile') + 1]
+    return None
+
+
+def simulate_evaluation():
+    delay = float(os.environ.get('FAKE_NIX_DELAY', '0'))
+    if delay > 0:
+        time.sleep(delay)
+
+
+def nix_env(args):
+    catalog = load_catalog()
+    flags = [a for a in args if a.startswith('-')]
+    query = '-qa' in flags or '-q' in flags or '--query' in flags
+    available = '-qa' in flags or '-a' in flags or '--available' in flags
+
+    if query and available:
+        simulate_evaluation()
+        patterns = [a for a in args if not a.startswith('-')]
+        if '-A' in flags or '--attr' in flags:
+            # Arguments are attribute paths; an unknown one fails the whole query
+            for attr in patterns:
+                if attr not in catalog:
+                    print(f"error: attribute '{attr.split('.')[-1]}' in selection path "
+                          f"'{attr}' not found", file=sys.stderr)
+                    return 1
+            matches = {attr: catalog[attr] for attr in patterns}
+        elif patterns:
+            try:
+                regexes = [re.compile(p) for p in patterns]
+            except re.error as e:
+                print(f"error: invalid regular expression: {e}", file=sys.stderr)
+                return 1
+            # Like nix-env, a selector that matches nothing fails the whole query
+            for pattern, regex in zip(patterns, regexes):
+                if not any(regex.fullmatch(package_name(info['name'])) for info in catalog.values()):
+                    print(f"error: selector '{pattern}' matches no derivations", file=sys.stderr)
+                    return 1
+            matches = {
+                attr: info for attr, info in catalog.items()
+                if any(r.fullmatch(package_name(info['name'])) for r in regexes)
+            }
+        else:
+            matches = catalog
+
+        if '--json' in flags:
+            if '--meta' not in flags:
+                # Like nix-env, only include meta attributes when asked to
+                matches = {attr: {k: v for k, v in info.items() if k != 'meta'}
+                           for attr, info in matches.items()}
+            print(json.dumps(matches))
+        else:
+            for info in matches.values():
+                print(info['name'])
+        return 0
+
+    if query:
+        # Installed packages in the user's or the given profile
+        for _, info in installed_entries(catalog, profile_arg(args)):
+            print(info['name'])
+        return 0
+
+    print(f"error: fake nix-env does not support: {' '.join(args)}", file=sys.stderr)
+    return 1
+
+
+def nix_string(value):
+    return '"' + value.replace('\\', '\\\\').replace('"', '\\"').replace('${', '\\${') + '"'
+
+
+def unescape_nix_string(value):
+    return re.sub(r'\\(.)', lambda m: m.group(1), value)
+
+
+def nix_repl():
+    """Line-based stand-in for `nix repl` with the Evaluator's helpers defined"""
+    catalog = load_catalog()
+    print("Welcome to Nix 2.18.1. Type :? for help.", file=sys.stderr, flush=True)
+    wrapped = re.compile(r'^"(?P<marker>[^"]*)" \+ \((?P<expr>.*)\)$')
+    search = re.compile(r'^nixguiSearch "(?P<pattern>(?:[^"\\]|\\.)*)"$')
+    for line in sys.stdin:
+        line = line.strip()
+        if not line or re.match(r'^[A-Za-z]+ = ', line):
+            continue  # bindings print nothing
+        match = wrapped.match(line)
+        expr = match.group('expr') if match else line
+        if expr == '""':
+            result = ''
+        elif expr == 'builtins.toString (builtins.length nixguiIndex)':
+            simulate_evaluation()
+            result = str(len(catalog))
+        elif search.match(expr):
+            try:
+                regex = re.compile(unescape_nix_string(search.match(expr).group('pattern')))
+            except re.error as e:
+                print(f"error: invalid regular expression: {e}", file=sys.stderr, flush=True)
+                continue
+            result = json.dumps({attr: {'name': info['name'], 'version': info.get('version', '')}
+                                 for attr, info in catalog.items()
+                                 if regex.fullmatch(package_name(info['name']))})
+        else:
+            print(f"error: fake nix repl does not support: {line[:80]}", file=sys.stderr, flush=True)
+            continue
+        print(nix_string((match.group('marker') if match else '') + result), flush=True)
+        print(flush=True)
+    return 0
+
+
+def nix(args):
+    if args[:1] == ['repl']:
+        return nix_repl()
+
+    if args[:2] == ['profile', 'list']:
+        for attr, info in installed_entries(load_catalog(), profile_arg(args)):
+            print(f"Name:               {attr}")
+            print(f"Flake attribute:    legacyPackages.x86_64-linux.{attr}")
+            print("Original flake URL: flake:nixpkgs")
+            print(f"Store paths:        /nix/store/00000000000000000000000000000000-{info['name']}")
+            print()
+        return 0
+
+    print(f"error: fake nix does not support: {' '.join(args)}", file=sys.stderr)
+    return 1
+
+
+if __name__ == '__main__':
+    command, args = sys.argv[1], sys.argv[2:]
+    sys.exit(nix_env(args) if command == 'nix-env' else nix(args))
@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+"""
+Synthetic load generator for a running search backend
+Simulates browser tabs typing into the search box with the same 500ms
+debounce the index-*.html pages use, plus periodic /health and
+/cache/stats polling, and checks every response it gets back
+
+Usage:
+  python3 bench/loadgen.py --users 20 --duration 60
+  python3 bench/loadgen.py --port 5001 --users 50 --target-p99-ms 250 --target-rps 30
+"""
+
+import argparse
+import http.client
+import json
+import os
+import random
+import sys
+import threading
+import time
+from urllib.parse import quote
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from benchmark import Client, percentile
+
+DEBOUNCE = 0.5  # setTimeout(..., 500) in the index-*.html pages
+
+# What people type into the box; mostly real package names, a few misses
+VOCABULARY = ['firefox', 'vim', 'neovim', 'git', 'python', 'python3', 'nodejs', 'docker',
+              'htop', 'btop', 'chromium', 'vscode', 'emacs', 'tmux', 'zsh', 'ripgrep',
+              'postgresql', 'redis', 'nginx', 'gimp', 'vlc', 'ffmpeg', 'steam', 'discord',
+              'signal', 'kitty', 'alacritty', 'rustc', 'cargo', 'go', 'jq', 'curl',
+              'libreoffice', 'thunderbird', 'blender', 'kubectl', 'terraform', 'ansible',
+              'numpy', 'flask', 'pytest', 'not-a-real-package']
+
+
+def plan_session(rng, duration, args):
+    """Build one tab's timeline of (time, kind, query) events
+
+    Keystrokes are only recorded for the report; like the frontend's
+    debounce, a search fires when no key has been pressed for DEBOUNCE
+    seconds since the last one, and never for an empty box.
+    """
+    events = []
+    keystrokes = 0
+    now = rng.uniform(0, args.ramp_up)
+    events.append((now, 'health', None))  # checkBackendHealth() on page load
+
+    while now < duration:
+        word = rng.choice(VOCABULARY)
+        typed = ''
+        pending_fire = None
+        for char in word:
+            if rng.random() < args.typo_rate:
+                # Wrong key, then backspace
+                typed += rng.choice('abcdefghijklmnopqrstuvwxyz')
+                now += rng.expovariate(1.0 / args.keystroke_interval)
+                keystrokes += 1
+                typed = typed[:-1]
+                now += rng.expovariate(1.0 / args.keystroke_interval)
+                keystrokes += 1
+            typed += char
+            keystrokes += 1
+            last_key = now
+            gap = rng.expovariate(1.0 / args.keystroke_interval)
+            if rng.random() < args.pause_rate:
+                gap += rng.uniform(DEBOUNCE, 2 * DEBOUNCE)
+            if gap >= DEBOUNCE and typed:
+                events.append((now + DEBOUNCE, 'search', typed))
+                pending_fire = None
+            else:
+                pending_fire = typed
+            now += gap
+        if pending_fire:
+            # The debounce timer started at the last keystroke, not after its gap
+            events.append((last_key + DEBOUNCE, 'search', pending_fire))
+        # Read the results before the next search
+        now += DEBOUNCE + rng.expovariate(1.0 / args.think_time)
+
+    if args.stats_interval > 0:
+        t = rng.uniform(0, args.stats_interval)
+        while t < duration:
+            events.append((t, 'stats', None))
+            t += args.stats_interval
+    if args.health_interval > 0:
+        t = rng.uniform(0, args.health_interval)
+        while t < duration:
+            events.append((t, 'health', None))
+            t += args.health_interval
+
+    events = sorted(e for e in events if e[0] < duration)
+    return events, keystrokes
+
+
+def check_response(kind, status, data):
+    """Return None if the response looks right, otherwise a short reason"""
+    if status != 200:
+        return f'HTTP {status}'
+    if not isinstance(data, dict):
+        return 'body is not a JSON object'
+    if kind == 'search':
+        results = data.get('results')
+        if not isinstance(results, list):
+            return 'missing results list'
+        if data.get('error'):
+            return 'error: ' + str(data['error'])[:60]
+        if len(results) > 50:
+            return 'more than 50 results'
+        for pkg in results:
+            if not isinstance(pkg, dict) or not all(k in pkg for k in ('name', 'version')):
+                return 'malformed result entry'
+        if 'total' in data and data['total'] < len(results):
+            return 'total smaller than results'
+    elif kind == 'health':
+        if data.get('status') != 'ok':
+            return 'status is not ok'
+    elif kind == 'stats':
+        if 'searchCache' not in data and 'error' not in data:
+            return 'missing searchCache'
+    return None
+
+
+class Recorder:
+    """Collects latencies and failures from all tabs"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = {'search': [], 'health': [], 'stats': []}
+        self.failures = {}
+        self.late = 0
+        self.keystrokes = 0
+
+    def record(self, kind, seconds, failure):
+        with self.lock:
+            if failure:
+                key = (kind, failure)
+                self.failures[key] = self.failures.get(key, 0) + 1
+            else:
+                self.latencies[kind].append(seconds)
+
+
+PATHS = {'health': '/health', 'stats': '/cache/stats'}
+
+
+def run_tab(index, start, args, recorder):
+    rng = random.Random(args.seed * 1000 + index)
+    events, keystrokes = plan_session(rng, args.duration, args)
+    client = Client(args.port, timeout=args.request_timeout, host=args.host)
+    late = 0
+    for at, kind, query in events:
+        delay = start + at - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        elif delay < -DEBOUNCE:
+            # Previous request still in flight when this one was due
+            late += 1
+        path = f'/search?q={quote(query)}' if kind == 'search' else PATHS[kind]
+        try:
+            seconds, status, data = client.get(path)
+            failure = check_response(kind, status, data)
+        except (OSError, http.client.HTTPException) as e:
+            seconds, failure = 0.0, type(e).__name__
+        recorder.record(kind, seconds, failure)
+    client.close()
+    with recorder.lock:
+        recorder.late += late
+        recorder.keystrokes += keystrokes
+
+
+def build_report(recorder, elapsed, args):
+    endpoints = {}
+    total_ok = 0
+    for kind, samples in recorder.latencies.items():
+        errors = sum(n for (k, _), n in recorder.failures.items() if k == kind)
+        total_ok += len(samples)
+        endpoints[kind] = {
+            'requests': len(samples) + errors,
+            'errors': errors,
+            'p50_ms': percentile(samples, 50) * 1000,
+            'p90_ms': percentile(samples, 90) * 1000,
+            'p99_ms': percentile(samples, 99) * 1000,
+            'max_ms': max(samples) * 1000 if samples else 0.0,
+        }
+    requests = sum(e['requests'] for e in endpoints.values())
+    return {
+        'users': args.users,
+        'duration': elapsed,
+        'requests': requests,
+        'throughput': requests / elapsed if elapsed > 0 else 0.0,
+        'goodput': total_ok / elapsed if elapsed > 0 else 0.0,
+        'keystrokes': recorder.keystrokes,
+        'searches': endpoints['search']['requests'],
+        'late': recorder.late,
+        'endpoints': endpoints,
+        'failures': {f'{k}: {reason}': n for (k, reason), n in sorted(recorder.failures.items())},
+    }
+
+
+def check_targets(report, args):
+    """Compare the report with the capacity targets; return failed checks"""
+    failed = []
+    search = report['endpoints']['search']
+    if args.target_p99_ms and search['p99_ms'] > args.target_p99_ms:
+        failed.append(f"search p99 {search['p99_ms']:.1f}ms > {args.target_p99_ms}ms")
+    if args.target_rps and report['goodput'] < args.target_rps:
+        failed.append(f"goodput {report['goodput']:.1f} req/s < {args.target_rps} req/s")
+    error_rate = sum(e['errors'] for e in report['endpoints'].values()) / max(report['requests'], 1)
+    if error_rate > args.max_error_rate:
+        failed.append(f"error rate {error_rate:.1%} > {args.max_error_rate:.1%}")
+    return failed
+
+
+def print_report(report):
+    print(f"\n📊 {report['users']} tabs for {report['duration']:.1f}s")
+    print(f"   {report['requests']} requests, {report['throughput']:.1f} req/s "
+          f"({report['goodput']:.1f} req/s successful)")
+    print(f"   {report['keystrokes']} keystrokes debounced into {report['searches']} searches, "
+          f"{report['late']} sent late")
+    print(f"\n   {'endpoint':<10} {'reqs':>6} {'errs':>5} {'p50 ms':>9} {'p90 ms':>9} "
+          f"{'p99 ms':>9} {'max ms':>9}")
+    for kind, e in report['endpoints'].items():
+        print(f"   {kind:<10} {e['requests']:>6} {e['errors']:>5} {e['p50_ms']:>9.1f} "
+              f"{e['p90_ms']:>9.1f} {e['p99_ms']:>9.1f} {e['max_ms']:>9.1f}")
+    if report['failures']:
+        print("\n❌ Failures:")
+        for reason, count in report['failures'].items():
+            print(f"   {count:>5} × {reason}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay debounced typing traffic against a backend')
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=5001)
+    parser.add_argument('--users', type=int, default=10, help='simulated browser tabs')
+    parser.add_argument('--duration', type=float, default=30, help='seconds of traffic per tab')
+    parser.add_argument('--ramp-up', type=float, default=2, help='spread tab start times over this many seconds')
+    parser.add_argument('--keystroke-interval', type=float, default=0.18,
+                        help='mean seconds between keystrokes')
+    parser.add_argument('--pause-rate', type=float, default=0.08,
+                        help='chance of pausing mid-word long enough to trigger a search')
+    parser.add_argument('--typo-rate', type=float, default=0.03, help='chance of a typo + backspace per key')
+    parser.add_argument('--think-time', type=float, default=3.0, help='mean seconds spent reading results')
+    parser.add_argument('--health-interval', type=float, default=0, help='per-tab /health poll period (0 = off)')
+    parser.add_argument('--stats-interval', type=float, default=0,
+                        help='per-tab /cache/stats poll period (0 = off)')
+    parser.add_argument('--request-timeout', type=float, default=35)
+    parser.add_argument('--seed', type=int, default=1, help='makes the traffic reproducible')
+    parser.add_argument('--target-p99-ms', type=float, help='fail if search p99 is above this')
+    parser.add_argument('--target-rps', type=float, help='fail if successful req/s is below this')
+    parser.add_argument('--max-error-rate', type=float, default=0.0, help='fail above this error fraction')
+    parser.add_argument('--json', help='also write the report to this file')
+    args = parser.parse_args()
+
+    print(f"🚦 {args.users} tabs typing at http://{args.host}:{args.port} for {args.duration:.0f}s...")
+    recorder = Recorder()
+    start = time.perf_counter()
+    threads = [threading.Thread(target=run_tab, args=(i, start, args, recorder), daemon=True)
+               for i in range(args.users)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    report = build_report(recorder, elapsed, args)
+    failed = check_targets(report, args)
+    report['targetsMet'] = not failed
+    print_report(report)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\n💾 Report written to {args.json}")
+
+    if failed:
+        print("\n❌ Capacity targets missed:")
+        for reason in failed:
+            print(f"   {reason}")
+        sys.exit(1)
+    print("\n✅ Capacity targets met")
+
+
+if __name__ == '__main__':
+    main()
@@ -18,9 +18,12 @@ python3 backend-with-status.py &
 BACKEND_PID=$!
 echo "   Backend PID: $BACKEND_PID"
 
-# Give backend time to start and cache installed packages
-echo "📦 Backend is checking installed packages..."
-sleep 3
+# Wait for backend to start; it checks installed packages in the background
+echo "📦 Waiting for backend to start..."
+for i in $(seq 1 60); do
+    curl -s http://localhost:5000/health >/dev/null && break
+    sleep 0.5
+done
 
 # Test backend
 if curl -s http://localhost:5000/health | grep -q "installed-status"; then
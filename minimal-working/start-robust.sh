@@ -38,9 +38,13 @@ python3 backend-robust.py &
 BACKEND_PID=$!
 echo "   Backend PID: $BACKEND_PID"
 
-# Wait for backend to start
+# Wait for backend to start; /health answers as soon as it is listening and
+# reports "ready" once the background installed-package check has finished
 echo "⏳ Waiting for backend to initialize..."
-sleep 3
+for i in $(seq 1 60); do
+    curl -s http://localhost:5001/health | grep -q '"ready": true' && break
+    sleep 0.5
+done
 
 # Test backend
 if curl -s http://localhost:5001/health | grep -q '"status": "ok"'; then